@@ -5,17 +5,21 @@ import requests
 import urllib.request
 from datetime import datetime, timezone
 from math import radians, cos, sin, asin, sqrt, atan2, degrees
+import shapely
 from shapely.geometry import Point, LineString
-from rich.console import Group
-from rich.panel import Panel
-from rich.table import Table
-from rich.text import Text
-from rich.spinner import Spinner
-from rich.align import Align
-from rich.live import Live
+# rich is imported inside the dashboard functions, so --headless never loads it
+import argparse
+import contextlib
 import psutil
+import heapq
+import numpy as np
+from bisect import bisect_left
+from collections import deque
+import select
 import socket
 import subprocess
+import threading
+import time as time_module
 import gc
 import sys
 import calendar
@@ -44,13 +48,9 @@ current_temperature_c = None
 # constants (adjust if needed)
 REFRESH_DURATION_MS = 13000        # keep refresh=True for this many ms after cycle start
 MIN_ALERT_INTERVAL = 60           # seconds between refresh cycles
-last_png_mtime = 0
-refresh_ready = False
 within_schedule= False
 
-# persistent state for refresh cycles (lives for the duration of main_loop())
-last_refresh_start = None         # datetime when last refresh cycle started, or None
-last_card_launch_time = None      # same as last_refresh_start (optional), used to ensure card3 launched once
+# refresh-cycle state lives per site in SiteAlerts
 
 
 
@@ -126,6 +126,15 @@ def get_ip_address():
 
 
 def get_wifi_strength():
+    # /proc/net/wireless has the same signal level as `iw`, without forking a process
+    try:
+        with open("/proc/net/wireless", "r") as f:
+            for line in f.readlines()[2:]:
+                iface, _, fields = line.partition(":")
+                if iface.strip() == "wlan0":
+                    return f"{int(float(fields.split()[2]))} dBm"
+    except Exception:
+        pass
     try:
         result = subprocess.run(['/sbin/iw', 'dev', 'wlan0', 'link'], capture_output=True, text=True, check=True)
         for line in result.stdout.splitlines():
@@ -138,10 +147,109 @@ def get_wifi_strength():
     except Exception:
         return "n/a"
 
+# Header metrics: how often the sampler thread refreshes each one (seconds)
+STATS_INTERVALS = {
+    "system": 2,      # CPU %, RAM %, CPU temperature
+    "wifi": 15,
+    "disk": 60,
+    "uptime": 30,
+    "ip": 300,        # safety net; normally refreshed on a netlink address change
+}
+RTMGRP_IPV4_IFADDR = 0x10
+
+
+class SystemStatsSampler(threading.Thread):
+    """Refreshes the header's system metrics on a background thread, each on its own interval."""
+
+    def __init__(self, intervals=STATS_INTERVALS):
+        super().__init__(name="system-stats", daemon=True)
+        self.intervals = dict(intervals)
+        self.values = {
+            "cpu_temp_c": None,
+            "mem_usage": None,
+            "cpu_usage": None,
+            "disk_usage": None,
+            "wifi": "n/a",
+            "ip": "n/a",
+            "uptime": "n/a",
+        }
+        self.samples = {name: 0 for name in self.intervals}
+        self.stop_event = threading.Event()
+
+    def sample(self, name):
+        try:
+            if name == "system":
+                temp_c, mem_usage, cpu_usage = get_system_info()
+                self.values.update(cpu_temp_c=temp_c, mem_usage=mem_usage, cpu_usage=cpu_usage)
+            elif name == "wifi":
+                self.values["wifi"] = get_wifi_strength()
+            elif name == "disk":
+                self.values["disk_usage"] = f"{psutil.disk_usage('/').percent}%"
+            elif name == "uptime":
+                self.values["uptime"] = get_uptime()
+            elif name == "ip":
+                self.values["ip"] = get_ip_address()
+        except Exception:
+            pass
+        self.samples[name] += 1
+
+    def open_netlink(self):
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_IPV4_IFADDR))
+            sock.setblocking(False)
+            return sock
+        except (AttributeError, OSError):
+            return None  # not Linux: the IP falls back to its polling interval
+
+    def run(self):
+        netlink = self.open_netlink()
+        due = {name: 0.0 for name in self.intervals}
+        try:
+            while not self.stop_event.is_set():
+                now = time_module.monotonic()
+                for name, interval in self.intervals.items():
+                    if now >= due[name]:
+                        self.sample(name)
+                        due[name] = now + interval
+
+                timeout = max(0.0, min(due.values()) - time_module.monotonic())
+                if netlink is None:
+                    self.stop_event.wait(timeout)
+                    continue
+                readable, _, _ = select.select([netlink], [], [], timeout)
+                if readable:
+                    try:
+                        while netlink.recv(65536):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    self.sample("ip")
+                    due["ip"] = time_module.monotonic() + self.intervals["ip"]
+        finally:
+            if netlink is not None:
+                netlink.close()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+system_stats = SystemStatsSampler()
+
+
 def render_header(spinner_frame, aircraft_list, current_temperature_c, within_schedule):
-    # First line text
+    from rich.align import Align
+    from rich.console import Group
+    from rich.panel import Panel
+    from rich.table import Table
+    from rich.text import Text
+
+    # First line text (spinner_frame is a frame string, or a rich Spinner that animates itself)
     line1 = Text()
-    line1.append(f"{spinner_frame} Tracking: {len(aircraft_list)} aircraft", style="bold cyan")
+    if isinstance(spinner_frame, str):
+        line1.append(f"{spinner_frame} Tracking: {len(aircraft_list)} aircraft", style="bold cyan")
+    else:
+        line1.append(f" Tracking: {len(aircraft_list)} aircraft", style="bold cyan")
 
     # Add schedule status indicator
     schedule_status = "✅ Within Schedule" if within_schedule else "❌ Outside Schedule"
@@ -150,37 +258,39 @@ def render_header(spinner_frame, aircraft_list, current_temperature_c, within_sc
     if current_temperature_c is not None:
         line1.append(f"  🌡️ {current_temperature_c}°C", style="bold magenta")
 
-    try:
-        cpu_temp_c, mem_usage, cpu_usage = get_system_info()
-
+    # Cached values only; SystemStatsSampler keeps them fresh in the background
+    stats = system_stats.values
+    if stats["mem_usage"] is not None:
+        cpu_temp_c = stats["cpu_temp_c"]
         if cpu_temp_c is not None:
             line1.append(f"  🔥 CPU: {cpu_temp_c:5.1f}°C", style="bold red")
         else:
             line1.append("  🔥 CPU: N/A", style="bold red")
 
-        line1.append(f"  🧠 {cpu_usage} CPU", style="bold yellow")
-        line1.append(f"  📈 {mem_usage} RAM", style="bold green")
-
-        disk = psutil.disk_usage('/')
-        disk_usage = f"{disk.percent}%"
-        line1.append(f"  💽 {disk_usage} Disk", style="bold blue")
-
-    except Exception:
+        line1.append(f"  🧠 {stats['cpu_usage']} CPU", style="bold yellow")
+        line1.append(f"  📈 {stats['mem_usage']} RAM", style="bold green")
+        line1.append(f"  💽 {stats['disk_usage'] or 'n/a'} Disk", style="bold blue")
+    else:
         line1.append(" ⚠️ Stats error", style="bold red")
 
     # Second line text
-    wifi_strength = get_wifi_strength()
-    ip_address = get_ip_address()
-    uptime = get_uptime()
+    wifi_strength = stats["wifi"]
+    ip_address = stats["ip"]
+    uptime = stats["uptime"]
 
     line2 = Text()
     line2.append(f"📶 WiFi: {wifi_strength}   ", style="bold cyan")
     line2.append(f"🌐 IP: {ip_address}   ", style="bold cyan")
     line2.append(f"⏱️ Uptime: {uptime}", style="bold cyan")
 
+    first_line = line1
+    if not isinstance(spinner_frame, str):
+        first_line = Table.grid()
+        first_line.add_row(spinner_frame, line1)
+
     # Create a Group to combine lines with a blank line in between, each centered
     group = Group(
-        Align.center(line1),
+        Align.center(first_line),
         Text("\n"),  # blank line for spacing
         Align.center(line2)
     )
@@ -189,12 +299,12 @@ def render_header(spinner_frame, aircraft_list, current_temperature_c, within_sc
     return header_panel
 
 
-def render_dashboard(aircraft_list, latest_alert, spinner_frame, within_schedule, temperature_c=None):
+DASHBOARD_MAX_ROWS = 25  # nearest aircraft shown in the table
 
-    # ─── Header ─────────────────────────────────────────────
-    header_panel = render_header(spinner_frame, aircraft_list, temperature_c, within_schedule)
 
-    # ─── Aircraft Table ─────────────────────────────────────
+def aircraft_table():
+    from rich.table import Table
+
     table = Table(expand=True)
     table.add_column("HEX")
     table.add_column("FLIGHT")
@@ -207,35 +317,62 @@ def render_dashboard(aircraft_list, latest_alert, spinner_frame, within_schedule
     table.add_column("TO", justify="center")
     table.add_column("ETA", justify="center")
     table.add_column("ICONS")
+    return table
 
-    for ac in sorted(aircraft_list.values(), key=lambda x: x["distance"]):
-        fa = ac.get("flightaware", {})
-        origin = fa.get("origin_iata", "n/a")
-        dest = fa.get("destination_iata", "n/a")
-        eta = fa.get("eta_minutes", "n/a")
-        if eta != "n/a" and eta is not None:
-            eta = f"{eta} min"
-        else:
-            eta = "n/a"
-        icons = ""
-        if ac.get("is_closing"):
-            icons += "🎯 "
-        if ac.get("alerted"):
-            icons += "🚨"
-
-        table.add_row(
-            ac["hex"],
-            ac["flight"],
-            f"{ac['distance']:.2f}",
-            f"{ac['bullseye_km']:.2f}" if ac["bullseye_km"] is not None else "n/a",
-            str(ac["altitude"]),
-            str(ac["heading"]),
-            str(ac["speed"]),
-            origin,
-            dest,
-            eta,
-            icons
-        )
+
+def aircraft_row(ac):
+    fa = ac.get("flightaware", {})
+    origin = fa.get("origin_iata", "n/a")
+    dest = fa.get("destination_iata", "n/a")
+    eta = fa.get("eta_minutes", "n/a")
+    if eta != "n/a" and eta is not None:
+        eta = f"{eta} min"
+    else:
+        eta = "n/a"
+    icons = ""
+    if ac.get("is_closing"):
+        icons += "🎯 "
+    if ac.get("alerted"):
+        icons += "🚨"
+
+    return (
+        ac["hex"],
+        ac["flight"],
+        f"{ac['distance']:.2f}",
+        f"{ac['bullseye_km']:.2f}" if ac["bullseye_km"] is not None else "n/a",
+        str(ac["altitude"]),
+        str(ac["heading"]),
+        str(ac["speed"]),
+        origin,
+        dest,
+        eta,
+        icons
+    )
+
+
+def fill_aircraft_table(rows, total):
+    table = aircraft_table()
+    for row in rows:
+        table.add_row(*row)
+    if len(rows) < total:
+        table.caption = f"{len(rows)} nearest of {total} aircraft"
+    return table
+
+
+def render_dashboard(aircraft_list, latest_alert, spinner_frame, within_schedule, temperature_c=None,
+                     table=None):
+    from rich.align import Align
+    from rich.console import Group
+    from rich.panel import Panel
+    from rich.text import Text
+
+    # ─── Header ─────────────────────────────────────────────
+    header_panel = render_header(spinner_frame, aircraft_list, temperature_c, within_schedule)
+
+    # ─── Aircraft Table ─────────────────────────────────────
+    if table is None:
+        rows = [aircraft_row(ac) for ac in sorted(aircraft_list.values(), key=lambda x: x["distance"])]
+        table = fill_aircraft_table(rows, len(aircraft_list))
 
     # Build alert panel safely
     if latest_alert and isinstance(latest_alert, dict) and latest_alert.get('flight'):
@@ -299,6 +436,53 @@ def render_dashboard(aircraft_list, latest_alert, spinner_frame, within_schedule
     return layout
 
 
+class DashboardModel:
+    """Builds the Live dashboard, reusing the aircraft Table while its rows are unchanged.
+
+    `render` returns None when nothing visible changed."""
+
+    def __init__(self, max_rows=DASHBOARD_MAX_ROWS):
+        from rich.spinner import Spinner
+
+        self.max_rows = max_rows
+        self.spinner = Spinner("dots", style="bold cyan")
+        self.table = None
+        self.table_rows = None  # (rows, aircraft count) self.table was built from
+        self.last_hash = None
+        self.stats = {"updates": 0, "skipped": 0, "tables_built": 0, "tables_reused": 0}
+
+    def aircraft_table(self, rows, total):
+        # The rich Table is rebuilt only when a shown row or the aircraft count changed
+        if self.table is not None and self.table_rows == (rows, total):
+            self.stats["tables_reused"] += 1
+            return self.table
+        self.table = fill_aircraft_table(rows, total)
+        self.table_rows = (rows, total)
+        self.stats["tables_built"] += 1
+        return self.table
+
+    def render(self, aircraft_list, latest_alert, within_schedule, temperature_c=None, force=False):
+        nearest = heapq.nsmallest(self.max_rows, aircraft_list.values(), key=lambda x: x["distance"])
+        rows = tuple(aircraft_row(ac) for ac in nearest)
+        stats = system_stats.values
+        state_hash = hash((
+            len(aircraft_list), within_schedule, temperature_c,
+            stats["cpu_temp_c"], stats["cpu_usage"], stats["mem_usage"], stats["disk_usage"],
+            stats["wifi"], stats["ip"], stats["uptime"],
+            rows,
+            json.dumps(latest_alert, sort_keys=True, default=str),
+        ))
+        if state_hash == self.last_hash and not force:
+            self.stats["skipped"] += 1
+            return None
+        self.last_hash = state_hash
+        self.stats["updates"] += 1
+
+        table = self.aircraft_table(rows, len(aircraft_list))
+        return render_dashboard(aircraft_list, latest_alert, self.spinner, within_schedule, temperature_c,
+                                table=table)
+
+
 import psutil
 
 def get_system_info():
@@ -350,6 +534,142 @@ def closest_approach_distance(lat1, lon1, heading_deg, ref_lat, ref_lon):
     return Point(ref_lat, ref_lon).distance(line) * 111
 
 
+EARTH_RADIUS_KM = 6371.0
+CPA_LOOKAHEAD_KM = 100
+
+
+def project_track(lats, lons, headings, km):
+    # Great-circle point `km` ahead along each heading, in degrees (numpy arrays)
+    lat = np.radians(np.asarray(lats, dtype=float))
+    heading = np.radians(np.asarray(headings, dtype=float))
+    ahead = km / EARTH_RADIUS_KM
+    proj_lat = np.arcsin(np.sin(lat) * np.cos(ahead) + np.cos(lat) * np.sin(ahead) * np.cos(heading))
+    proj_lon = np.radians(np.asarray(lons, dtype=float)) + np.arctan2(
+        np.sin(heading) * np.sin(ahead) * np.cos(lat), np.cos(ahead) - np.sin(lat) * np.sin(proj_lat))
+    return np.degrees(proj_lat), np.degrees(proj_lon)
+
+
+def site_geometry(lats, lons, headings, site_lats, site_lons):
+    """Distance, closest approach and distance along track to it (km) of n aircraft to m sites.
+
+    Three (n, m) arrays. Same maths as haversine() and closest_approach_distance(), one
+    aircraft per row and one site per column: the track is projected CPA_LOOKAHEAD_KM
+    ahead and the site's distance to that segment is taken in degrees, as shapely does,
+    times 111. The closest approach terms are NaN where the heading is NaN.
+    """
+    lat = np.asarray(lats, dtype=float)
+    lon = np.asarray(lons, dtype=float)
+    site_lat = np.asarray(site_lats, dtype=float)
+    site_lon = np.asarray(site_lons, dtype=float)
+
+    lat1 = np.radians(lat)[:, None]
+    lat2 = np.radians(site_lat)[None, :]
+    dlat = lat2 - lat1
+    dlon = np.radians(site_lon)[None, :] - np.radians(lon)[:, None]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    distance = EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    proj_lat, proj_lon = project_track(lat, lon, headings, CPA_LOOKAHEAD_KM)
+    dx = (proj_lat - lat)[:, None]
+    dy = (proj_lon - lon)[:, None]
+    px = site_lat[None, :] - lat[:, None]
+    py = site_lon[None, :] - lon[:, None]
+    t = np.clip((px * dx + py * dy) / (dx * dx + dy * dy), 0.0, 1.0)
+    bullseye = np.hypot(px - t * dx, py - t * dy) * 111
+    return distance, bullseye, t * CPA_LOOKAHEAD_KM
+
+
+# Geofences (--fences PATH): approach corridors, runway extended centrelines, ...
+FENCE_LOOKAHEAD_KM = 10  # length of the projected track segment tested against fences
+
+
+def load_fences(path):
+    """Geofences from a JSON list. Coordinates are [lat, lon] pairs, like the rest of alert18:
+
+        [{"name": "24R final", "polygon": [[43.70, -79.55], [43.74, -79.48], [43.73, -79.47], [43.69, -79.54]],
+          "max_altitude_ft": 5000},
+         {"name": "RWY 06L centreline", "centerline": [[43.66, -79.64], [43.60, -79.75]], "width_km": 1.5,
+          "site": "cottage"}]
+
+    A centerline is buffered by width_km / 2 either side (using the same 111 km per
+    degree as closest_approach_distance). "site" names the site the fence alerts for
+    (default: the first); max_altitude_ft ignores aircraft above it.
+    """
+    with open(path) as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError(f"{path}: expected a list of fences")
+
+    fences = []
+    for i, entry in enumerate(entries):
+        name = entry.get("name") or f"fence{i + 1}"
+        if "polygon" in entry:
+            geometry = shapely.Polygon(entry["polygon"])
+        elif "centerline" in entry:
+            geometry = shapely.LineString(entry["centerline"]).buffer(entry.get("width_km", 1.0) / 2 / 111,
+                                                                      cap_style="flat")
+        else:
+            raise ValueError(f"{path}: fence {name!r} needs a polygon or a centerline")
+        if geometry.is_empty or not geometry.is_valid:
+            raise ValueError(f"{path}: fence {name!r} is not a valid polygon")
+        fences.append({
+            "name": name,
+            "geometry": geometry,
+            "site": entry.get("site"),
+            "max_altitude_ft": entry.get("max_altitude_ft"),
+        })
+    return fences
+
+
+class GeofenceIndex:
+    """Prepared fence polygons in an STRtree, tested against all aircraft in one query per tick."""
+
+    def __init__(self, fences, sites):
+        site_names = [site["name"] for site in sites]
+        for fence in fences:
+            if fence["site"] is not None and fence["site"] not in site_names:
+                raise ValueError(f"fence {fence['name']!r}: unknown site {fence['site']!r}")
+        self.names = [fence["name"] for fence in fences]
+        self.sites = np.array([site_names.index(fence["site"]) if fence["site"] else 0 for fence in fences])
+        self.max_altitude = np.array([fence["max_altitude_ft"] if fence["max_altitude_ft"] is not None
+                                      else np.inf for fence in fences], dtype=float)
+        self.geometries = np.array([fence["geometry"] for fence in fences], dtype=object)
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+
+    def __len__(self):
+        return len(self.names)
+
+    def hits(self, lats, lons, headings, altitudes):
+        """(aircraft, fence) index pairs: the aircraft is inside the fence or its track crosses it.
+
+        Aircraft above a fence's max_altitude_ft don't count; unknown altitudes (NaN) do.
+        """
+        lat = np.asarray(lats, dtype=float)
+        lon = np.asarray(lons, dtype=float)
+        if not len(lat) or not len(self.names):
+            return np.empty((2, 0), dtype=np.intp)
+
+        points = shapely.points(lat, lon)
+        aircraft, fence = self.tree.query(points)
+        inside = shapely.intersects(self.geometries[fence], points[aircraft])
+        pairs = [np.stack([aircraft[inside], fence[inside]])]
+
+        heading = np.asarray(headings, dtype=float)
+        moving = np.flatnonzero(~np.isnan(heading))
+        if len(moving):
+            proj_lat, proj_lon = project_track(lat[moving], lon[moving], heading[moving], FENCE_LOOKAHEAD_KM)
+            segments = shapely.linestrings(np.stack([np.stack([lat[moving], lon[moving]], axis=1),
+                                                     np.stack([proj_lat, proj_lon], axis=1)], axis=1))
+            segment, fence = self.tree.query(segments)
+            crossing = shapely.intersects(self.geometries[fence], segments[segment])
+            pairs.append(np.stack([moving[segment[crossing]], fence[crossing]]))
+
+        pairs = np.unique(np.concatenate(pairs, axis=1), axis=1)
+        altitude = np.asarray(altitudes, dtype=float)[pairs[0]]
+        return pairs[:, ~(altitude > self.max_altitude[pairs[1]])]
+
+
 def get_temperature(lat, lon):
     try:
         url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&current=temperature_2m"
@@ -391,6 +711,9 @@ def lookup_adsbdb_info(hexcode):
     return None
 
 
+FLIGHTAWARE_TIMEOUT_SECONDS = 15
+
+
 async def scrape_flightaware(flight_number):
     if not flight_number or flight_number == "n/a":
         return None
@@ -404,9 +727,12 @@ async def scrape_flightaware(flight_number):
     }
     req = urllib.request.Request(url, headers=headers)
 
+    def fetch():
+        with urllib.request.urlopen(req, timeout=FLIGHTAWARE_TIMEOUT_SECONDS) as response:
+            return response.read().decode('utf-8')
+
     try:
-        with urllib.request.urlopen(req) as response:
-            html = response.read().decode('utf-8')
+        html = await asyncio.to_thread(fetch)  # keeps the scan stage running meanwhile
     except Exception as e:
         print(f"❌ Error scraping FlightAware {flight_number}: {e}")
         return None
@@ -459,6 +785,219 @@ async def scrape_flightaware(flight_number):
         del json_text
         return None
 
+def launch_card_renderer(json_path=None, png_path=None):
+    args = [sys.executable, 'card5.py']
+    if json_path:
+        args += ['--json', json_path]
+    if png_path:
+        args += ['--png', png_path]
+    subprocess.Popen(args,
+                     stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL)
+
+
+class WallClock:
+    # main_loop's notion of time; replay.py swaps in a virtual clock
+    def utcnow(self):
+        return datetime.utcnow()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+clock = WallClock()
+
+
+# Tick instrumentation (--metrics DIR): written every METRICS_EXPORT_SECONDS as
+# alert18.prom (node_exporter textfile collector format) and alert18_metrics.json
+METRICS_EXPORT_SECONDS = 15
+METRICS_ROLLING_TICKS = 600   # window for the JSON percentiles, ~10 minutes of ticks
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_COUNTERS = ("aircraft_parsed", "enrichments_started", "cache_hits", "bytes_written", "ingest_errors",
+                    "cards_prestaged", "cards_promoted")
+NULL_STAGE = contextlib.nullcontext()
+
+
+class StageTimer:
+    # Sums a scan-tick stage's time into the tick totals
+    __slots__ = ("totals", "name", "started")
+
+    def __init__(self, totals, name):
+        self.totals = totals
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time_module.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.totals[self.name] = self.totals.get(self.name, 0.0) + time_module.perf_counter() - self.started
+        return False
+
+
+class SpanTimer:
+    # Observes one run of a stage on its own, whichever task it runs in
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time_module.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.metrics.spans, self.name, time_module.perf_counter() - self.started)
+        return False
+
+
+class TickMetrics:
+    """Scan-tick stage timings (`stage`), per-run timings of the other tasks' stages (`span`) and counters."""
+
+    def __init__(self):
+        self.enabled = False
+        self.out_dir = None
+        self.started = time_module.time()
+        self.ticks = 0
+        self.tick_started = 0.0
+        self.tick_stages = {}
+        self.tick_counts = {}
+        self.last_tick = {}
+        self.stages = {}  # scan stage -> {"buckets": [...], "sum": s, "count": n, "rolling": deque of seconds}
+        self.spans = {}   # enrich/alert/publish stage -> the same, one observation per run
+        self.counters = dict.fromkeys(METRICS_COUNTERS, 0)
+        self.last_export = time_module.monotonic()
+
+    def enable(self, out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.enabled = True
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        return StageTimer(self.tick_stages, name)
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        return SpanTimer(self, name)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.tick_counts[name] = self.tick_counts.get(name, 0) + n
+
+    def begin_tick(self):
+        if self.enabled:
+            self.tick_started = time_module.perf_counter()
+
+    def end_tick(self):
+        if not self.enabled:
+            return
+        self.tick_stages["tick"] = time_module.perf_counter() - self.tick_started
+        self.ticks += 1
+        for name, seconds in self.tick_stages.items():
+            self.observe(self.stages, name, seconds)
+        for name, n in self.tick_counts.items():
+            self.counters[name] = self.counters.get(name, 0) + n
+        self.last_tick = dict(self.tick_counts)
+        self.tick_stages.clear()
+        self.tick_counts.clear()
+
+        if time_module.monotonic() - self.last_export >= METRICS_EXPORT_SECONDS:
+            self.export()
+
+    def observe(self, histograms, name, seconds):
+        hist = histograms.get(name)
+        if hist is None:
+            hist = histograms[name] = {"buckets": [0] * (len(METRICS_BUCKETS) + 1), "sum": 0.0, "count": 0,
+                                       "rolling": deque(maxlen=METRICS_ROLLING_TICKS)}
+        hist["buckets"][bisect_left(METRICS_BUCKETS, seconds)] += 1
+        hist["sum"] += seconds
+        hist["count"] += 1
+        hist["rolling"].append(seconds)
+
+    def prometheus_text(self):
+        lines = []
+        for metric, histograms, help_text in (
+                ("alert18_stage_seconds", self.stages,
+                 "Time in each scan stage per scan tick; tick is the whole scan tick."),
+                ("alert18_span_seconds", self.spans,
+                 "Wall time of each run of an enrich/alert/publish stage; runs may overlap.")):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+            for name, hist in sorted(histograms.items()):
+                cumulative = 0
+                for bound, n in zip(METRICS_BUCKETS + ("+Inf",), hist["buckets"]):
+                    cumulative += n
+                    lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{stage="{name}"}} {hist["sum"]:.6f}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {hist["count"]}')
+        lines += [
+            "# HELP alert18_ticks_total Scan ticks completed.",
+            "# TYPE alert18_ticks_total counter",
+            f"alert18_ticks_total {self.ticks}",
+        ]
+        for name, value in sorted(self.counters.items()):
+            lines += [f"# TYPE alert18_{name}_total counter", f"alert18_{name}_total {value}"]
+        return "\n".join(lines) + "\n"
+
+    def summary(self, histograms):
+        summary = {}
+        for name, hist in sorted(histograms.items()):
+            window = sorted(hist["rolling"])
+            summary[name] = {
+                "count": hist["count"],
+                "total_s": round(hist["sum"], 4),
+                "last_ms": round(hist["rolling"][-1] * 1000, 3),
+                "mean_ms": round(1000 * sum(window) / len(window), 3),
+                "p50_ms": round(1000 * window[int(round(0.50 * (len(window) - 1)))], 3),
+                "p95_ms": round(1000 * window[int(round(0.95 * (len(window) - 1)))], 3),
+                "max_ms": round(1000 * window[-1], 3),
+            }
+        return summary
+
+    def snapshot(self):
+        return {
+            "generated": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "uptime_s": round(time_module.time() - self.started),
+            "ticks": self.ticks,
+            "rolling_ticks": METRICS_ROLLING_TICKS,
+            # stages: scan-task time per scan tick ("tick" is the whole tick, the others add up
+            # to part of it); spans: wall time per run of the other tasks' stages, which overlap
+            # each other and the scan, so they don't add up to anything
+            "stages": self.summary(self.stages),
+            "spans": self.summary(self.spans),
+            "counters": dict(self.counters),
+            "last_tick": self.last_tick,
+        }
+
+    def export(self):
+        if not self.enabled:
+            return
+        self.last_export = time_module.monotonic()
+        for filename, text in (("alert18.prom", self.prometheus_text()),
+                               ("alert18_metrics.json", json.dumps(self.snapshot(), indent=2))):
+            # Written aside and renamed, so a scrape never sees a half-written file
+            path = os.path.join(self.out_dir, filename)
+            try:
+                with open(path + ".tmp", "w") as f:
+                    f.write(text)
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                print(f"⚠️ Failed to write metrics {path}: {e}")
+
+
+metrics = TickMetrics()
+
+
+def read_aircraft_json():
+    with open(AIRCRAFT_JSON_PATH) as f:
+        return json.load(f)
+
+
 def safe_float(value, default=0.0):
     try:
         return float(value)
@@ -471,256 +1010,839 @@ def clear_console():
 
 from datetime import datetime, timedelta
 
-# Store seen aircraft hexes and their data with timestamps
+ATTACH_SNAPSHOT_FIELDS = ("hex", "flight", "distance", "bullseye_km", "altitude", "heading", "speed",
+                          "is_closing", "alerted", "flightaware")
+
+
+def log_event(event, **fields):
+    # One logfmt line per state transition (headless mode): ts=... event=... key=value ...
+    parts = [f"ts={clock.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')}", f"event={event}"]
+    for key, value in fields.items():
+        if value is None:
+            continue
+        if isinstance(value, float):
+            value = f"{value:.2f}"
+        value = str(value)
+        if not value or any(c in value for c in ' "='):
+            value = json.dumps(value, ensure_ascii=False)
+        parts.append(f"{key}={value}")
+    print(" ".join(parts), flush=True)
+
+
+class SnapshotServer:
+    """Local unix socket that streams one JSON dashboard snapshot per tick to attached clients.
+
+    `alert18.py --attach PATH` renders them with the normal rich dashboard, so a headless
+    daemon can be inspected without ever rendering anything itself.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.clients = set()
+        self.server = None
+
+    async def start(self):
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self.on_connect, path=self.path)
+        log_event("attach_socket", path=self.path)
+
+    async def on_connect(self, reader, writer):
+        self.clients.add(writer)
+        log_event("attach", clients=len(self.clients))
+
+    def publish(self, aircraft_list, latest_alert, within_schedule, temperature_c):
+        if not self.clients:
+            return  # nothing is serialized while nobody is attached
+        snapshot = {
+            "aircraft": [{k: ac.get(k) for k in ATTACH_SNAPSHOT_FIELDS} for ac in aircraft_list.values()],
+            "latest_alert": latest_alert,
+            "within_schedule": within_schedule,
+            "temperature_c": temperature_c,
+            "stats": system_stats.values,
+        }
+        line = (json.dumps(snapshot, default=str) + "\n").encode()
+        for writer in list(self.clients):
+            if writer.is_closing() or writer.transport.get_write_buffer_size() > 1 << 20:
+                self.clients.discard(writer)  # gone, or too slow to keep up
+                writer.close()
+                log_event("detach", clients=len(self.clients))
+                continue
+            writer.write(line)
 
-async def main_loop():
-    global spinner_index, last_alert_write_time, latest_alert, current_temperature_c
-    global last_refresh_start, last_card_launch_time, within_schedule
+    def close(self):
+        for writer in self.clients:
+            writer.close()
+        if self.server is not None:
+            self.server.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
 
-    aircraft_list = {}
-    last_alerted_flight = None  # Track last alerted flight number
-    png_path = "/usr/share/skyaware/html/flight_card.png"
 
-    refresh_ready = False
-    refresh_ready_time = None
+async def attach(path):
+    # Render a headless instance's dashboard from its snapshot socket
+    from rich.live import Live
+    from rich.text import Text
 
-    with Live(render_dashboard(aircraft_list, latest_alert, spinner_frames[spinner_index], within_schedule), refresh_per_second=1, screen=True) as live:
+    reader, writer = await asyncio.open_unix_connection(path, limit=16 * 1024 * 1024)
+    dashboard = DashboardModel()
+    with Live(Text(f"Attached to {path}, waiting for data..."), refresh_per_second=1, screen=True) as live:
         while True:
+            line = await reader.readline()
+            if not line:
+                break
+            snapshot = json.loads(line)
+            system_stats.values = snapshot["stats"]
+            aircraft_list = {ac["hex"]: ac for ac in snapshot["aircraft"]}
+            view = dashboard.render(aircraft_list, snapshot["latest_alert"], snapshot["within_schedule"],
+                                    snapshot["temperature_c"])
+            if view is not None:
+                live.update(view)
+    writer.close()
+    print(f"Disconnected from {path}")
+
+
+# main_loop pipeline (see AlertPipeline)
+ENRICH_WORKERS = 4       # concurrent adsbdb lookups
+ENRICH_QUEUE_MAX = 64    # new aircraft waiting for a lookup; the overflow is retried next tick
+PNG_PATH = "/usr/share/skyaware/html/flight_card.png"
+CARD_URL_BASE = "http://192.168.0.105:8080/"
+
+
+def default_sites():
+    # The home site from the module constants (read at call time, so overrides still apply)
+    return [{
+        "name": "home",
+        "lat": REFERENCE_LAT,
+        "lon": REFERENCE_LON,
+        "distance_alert_km": DISTANCE_ALERT_KM,
+        "bullseye_alert_km": BULLSEYE_ALERT_KM,
+        "alert_json": ALERT_JSON_FILE,
+        "card_png": PNG_PATH,
+    }]
+
+
+def load_sites(path):
+    """Reference sites from a JSON list, for example
+
+        [{"name": "home", "lat": 43.666426, "lon": -79.422638},
+         {"name": "cottage", "lat": 44.9, "lon": -79.1, "distance_alert_km": 15,
+          "alert_json": "/var/www/html/cottage.json", "card_png": "/var/www/html/cottage.png"}]
+
+    Thresholds default to DISTANCE_ALERT_KM / BULLSEYE_ALERT_KM. The first site defaults
+    to the usual alert JSON and card; the others need an alert_json and only get a card
+    rendered when they name a card_png.
+    """
+    with open(path) as f:
+        entries = json.load(f)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path}: expected a non-empty list of sites")
+
+    sites = []
+    for i, entry in enumerate(entries):
+        name = entry.get("name") or f"site{i + 1}"
+        if "lat" not in entry or "lon" not in entry:
+            raise ValueError(f"{path}: site {name!r} needs lat and lon")
+        if i > 0 and not entry.get("alert_json"):
+            raise ValueError(f"{path}: site {name!r} needs an alert_json path")
+        if name in (site["name"] for site in sites):
+            raise ValueError(f"{path}: duplicate site name {name!r}")
+        sites.append({
+            "name": name,
+            "lat": float(entry["lat"]),
+            "lon": float(entry["lon"]),
+            "distance_alert_km": float(entry.get("distance_alert_km", DISTANCE_ALERT_KM)),
+            "bullseye_alert_km": float(entry.get("bullseye_alert_km", BULLSEYE_ALERT_KM)),
+            "alert_json": entry.get("alert_json") or ALERT_JSON_FILE,
+            "card_png": entry.get("card_png", PNG_PATH if i == 0 else None),
+        })
+    return sites
+
+
+class LatestQueue(asyncio.Queue):
+    # One-slot queue: a newer item replaces one the consumer has not picked up yet
+    def __init__(self):
+        super().__init__(maxsize=1)
+        self.replaced = 0
+
+    def put_latest(self, item):
+        if self.full():
+            self.get_nowait()
+            self.task_done()
+            self.replaced += 1
+        self.put_nowait(item)
+
+
+def update_flight_timing(fa_info, now):
+    # ETA and progress from the FlightAware times, relative to now
+    eta_minutes = None
+    try:
+        landing_time_str = fa_info.get("landing_time_estimated")
+        if landing_time_str:
+            landing_time = datetime.strptime(landing_time_str, "%Y-%m-%d %H:%M:%S UTC")
+            eta_minutes = int((landing_time - now).total_seconds() / 60)
+    except Exception:
+        pass
+    fa_info["eta_minutes"] = eta_minutes
+
+    percent_complete = None
+    try:
+        actual_takeoff_str = fa_info.get("takeoff_time_actual")
+        estimated_arrival_str = fa_info.get("arrival_time_estimated")
+        if actual_takeoff_str and estimated_arrival_str:
+            actual_takeoff = datetime.strptime(actual_takeoff_str, "%Y-%m-%d %H:%M:%S UTC")
+            estimated_arrival = datetime.strptime(estimated_arrival_str, "%Y-%m-%d %H:%M:%S UTC")
+            total_duration = (estimated_arrival - actual_takeoff).total_seconds()
+            elapsed = (now - actual_takeoff).total_seconds()
+            if total_duration > 0:
+                percent_complete = max(0, min(100, (elapsed / total_duration) * 100))
+    except Exception:
+        percent_complete = None
+    fa_info["percent_complete"] = percent_complete
+
+
+# Alert scheduling per site (see SiteAlerts)
+ALERT_HANDOFF_SECONDS = 15   # another aircraft may take over the card this long after the last cycle
+HANDOFF_MARGIN_SECONDS = 30  # ...if it reaches closest approach this much sooner than the current one
+PRESTAGE_COUNT = 2           # queued candidates whose FlightAware info and card are prepared ahead
+PRESTAGE_MAX_AGE_SECONDS = MIN_ALERT_INTERVAL / 2  # staged cards are re-rendered after this long
+KNOTS_TO_KMH = 1.852
+
+
+def time_to_cpa(along_km, speed_kt):
+    # Seconds until the closest point of approach at the current ground speed (inf if unknown)
+    speed_kmh = safe_float(speed_kt) * KNOTS_TO_KMH
+    if along_km is None or speed_kmh <= 0:
+        return float("inf")
+    return along_km / speed_kmh * 3600
+
+
+class SiteAlerts:
+    """Alert state for one reference site: candidates queued by time to closest approach, the next few pre-staged."""
+
+    def __init__(self, pipeline, site, index):
+        self.pipeline = pipeline
+        self.site = site
+        self.index = index
+        # tag transition log lines with the site once there is more than one
+        self.log_fields = {"site": site["name"]} if len(pipeline.sites) > 1 else {}
+
+        self.alert_hex = None
+        self.cycle_hex = None
+        self.last_alerted_flight = None
+        self.last_refresh_start = None
+        self.last_card_launch_time = None
+        self.refresh_ready = False
+        self.refresh_ready_time = None
+        self.last_png_mtime = 0
+        self.last_refresh_flag = False
+        self.temperature_c = None
+        self.latest_alert = None
+        self.version = 0
+        self.written_version = 0
+
+        self.queue = []    # (time to CPA, distance, hex) of the first candidates
+        self.staged = {}   # hex -> (when, staged card path or None)
+        self.staging = {}  # hex -> task preparing it
+        card_png = site["card_png"]
+        self.stage_dir = os.path.join(os.path.dirname(card_png) or ".", "card_stage") if card_png else None
+
+    def log(self, event, **fields):
+        if self.pipeline.headless:
+            log_event(event, **fields, **self.log_fields)
+
+    def schedule(self):
+        # Alert candidates, soonest closest approach first (PRESTAGE_COUNT + 1 of them). Aircraft
+        # past their closest approach queue behind the approaching ones; the current alert stays
+        # at the head unless a challenger gets there HANDOFF_MARGIN_SECONDS sooner.
+        i = self.index
+        site = self.site
+        aircraft_list = self.pipeline.aircraft_list
+        candidates = []
+        current = None
+        for ac in aircraft_list.values():
+            if ac.get("flight") and (
+                    ac["site_fenced"][i]
+                    or ac["site_distance"][i] <= site["distance_alert_km"] and ac["site_closing"][i]):
+                along_km = ac["site_along_km"][i]
+                entry = (not along_km, time_to_cpa(along_km, ac["speed"]), ac["site_distance"][i], ac["hex"])
+                candidates.append(entry)
+                if ac["hex"] == self.alert_hex:
+                    current = entry
+        queue = heapq.nsmallest(PRESTAGE_COUNT + 1, candidates)
+        if (current is not None and queue[0] is not current and not current[0]
+                and queue[0][1] > current[1] - HANDOFF_MARGIN_SECONDS):
+            queue = [current] + [entry for entry in queue if entry is not current][:PRESTAGE_COUNT]
+        self.queue = queue
+        return [aircraft_list[entry[3]] for entry in queue]
+
+    def build_alert(self, ac, fa_info, temperature_c, refresh_flag):
+        i = self.index
+        card_png = self.site["card_png"]
+        return {
+            "display": within_schedule,
+            "refresh": refresh_flag,
+            "refreshInterval": 10000,
+            "png_url": CARD_URL_BASE + os.path.basename(card_png) if within_schedule and ac and card_png else "",
+            "flight": ac["flight"] if ac else "",
+            "aircraft_info": ac["adsb"] if ac else {},
+            "flight_info": fa_info,
+            "eta_minutes": fa_info.get("eta_minutes") if fa_info else None,
+            "speed": ac.get("speed") if ac else None,
+            "heading": ac.get("heading") if ac else None,
+            "altitude": ac.get("altitude") if ac else None,
+            "bullseye_km": ac["site_bullseye"][i] if ac else None,
+            "fences": list(ac["fences"]) if ac else [],
+            "flight_progress": 100 - (fa_info.get("distance_remaining_nm", 0) /
+                                      max((fa_info.get("distance_elapsed_nm", 1) +
+                                           fa_info.get("distance_remaining_nm", 0)), 1)) * 100
+                                if fa_info.get("distance_remaining_nm") and fa_info.get("distance_elapsed_nm") else 0,
+            "departure_time_actual": fa_info.get("departure_time_actual"),
+            "arrival_time_estimated": fa_info.get("arrival_time_estimated"),
+            "percent_complete": fa_info.get("percent_complete"),
+            "temperature_c": temperature_c,
+        }
+
+    async def evaluate(self, now):
+        pipeline = self.pipeline
+        i = self.index
+        card_png = self.site["card_png"]
+
+        with metrics.span("select"):
+            queue = self.schedule()
+
+        if queue:
+            ac = queue[0]
+            flight = ac["flight"]
+            hexcode = ac["hex"]
+            if hexcode != self.alert_hex:
+                self.log("alert_start", hex=hexcode, flight=flight, dist_km=ac["site_distance"][i],
+                         bullseye_km=ac["site_bullseye"][i], fences=",".join(ac["fences"]) or None)
+            self.alert_hex = hexcode
+
+            # Decide if starting a refresh cycle: the same aircraft every MIN_ALERT_INTERVAL,
+            # the next one in the queue after ALERT_HANDOFF_SECONDS
+            start_refresh_cycle = False
+            if self.last_refresh_start is None:
+                start_refresh_cycle = True
+            else:
+                seconds_since_last_refresh_start = (now - self.last_refresh_start).total_seconds()
+                interval = MIN_ALERT_INTERVAL if hexcode == self.cycle_hex else ALERT_HANDOFF_SECONDS
+                if seconds_since_last_refresh_start >= interval:
+                    start_refresh_cycle = True
+
+            if start_refresh_cycle:
+                staged_png = self.take_staged(hexcode)
+                self.log("refresh_cycle", flight=flight, hex=hexcode, prestaged=True if staged_png else None)
+                self.last_refresh_start = now
+                self.cycle_hex = hexcode
+                self.refresh_ready = False
+                self.refresh_ready_time = None
+                self.last_png_mtime = get_mtime(card_png) if card_png else 0
+
+                if staged_png:
+                    # Already rendered: swap it in now, FlightAware below comes from the cache
+                    with metrics.span("card_launch"):
+                        promoted = self.promote(staged_png, card_png)
+                else:
+                    promoted = False
+
+                # The card needs the adsbdb info; it is normally long done by the time a plane is close
+                pending = pipeline.enrich_pending.get(hexcode)
+                if pending is not None:
+                    await pending.wait()
+
+                fa_info = await pipeline.flightaware(ac, now)
+                ac = pipeline.aircraft_list.get(hexcode, ac)  # scan may have moved it on meanwhile
+                temperature_c = await pipeline.temperature(ac, now)
+                self.temperature_c = temperature_c
+                update_flight_timing(fa_info, now)
+
+                # Launch card5.py only if within_schedule is True. It reads the site JSON, so this
+                # cycle's alert goes there first rather than with the next publish
+                if card_png and not promoted:
+                    self.latest_alert = self.build_alert(ac, fa_info, temperature_c, False)
+                    self.version += 1
+                    self.write_json()
+                    with metrics.span("card_launch"):
+                        launch_card_renderer(self.site["alert_json"], card_png)
+                self.last_card_launch_time = self.last_refresh_start
+
+            else:
+                fa_info = ac.get("flightaware", {}) or {}
+                temperature_c = await pipeline.temperature(ac, now)
+                self.temperature_c = temperature_c
+                update_flight_timing(fa_info, now)
+                ac = pipeline.aircraft_list.get(hexcode, ac)
+
+        else:
+            if self.alert_hex is not None:
+                self.log("alert_end", hex=self.alert_hex)
+            self.alert_hex = None
+            ac = None
+            fa_info = {}
+            flight = None
+            temperature_c = self.temperature_c  # maintain previous temperature or None
+
+        # Determine refresh_flag only if within_schedule and aircraft present
+        refresh_flag = False
+        if within_schedule and ac and card_png:
+            if flight != self.last_alerted_flight:
+                current_png_mtime = get_mtime(card_png)
+                if not self.refresh_ready and current_png_mtime > self.last_png_mtime:
+                    self.refresh_ready = True
+                    self.refresh_ready_time = now
+                if self.refresh_ready and self.refresh_ready_time is not None:
+                    elapsed_ms = (now - self.refresh_ready_time).total_seconds() * 1000.0
+                    if elapsed_ms <= REFRESH_DURATION_MS:
+                        refresh_flag = True
+                        self.last_alerted_flight = flight
+                    else:
+                        self.refresh_ready = False
+                        self.refresh_ready_time = None
+            else:
+                refresh_flag = False
+        else:
+            self.last_alerted_flight = None
+
+        self.latest_alert = self.build_alert(ac, fa_info, temperature_c, refresh_flag)
+        self.version += 1
+
+        if refresh_flag and not self.last_refresh_flag:
+            self.log("display_refresh", flight=flight)
+        self.last_refresh_flag = refresh_flag
+
+        if ac:
+            ac["alerted"] = True
+
+        await self.prestage(queue, now)
+
+    async def prestage(self, queue, now):
+        # Get the aircraft behind the current alert ready, and drop what is no longer queued
+        queued = {ac["hex"] for ac in queue}
+        for hexcode in [h for h in self.staged if h not in queued]:
+            self.discard_staged(hexcode)
+
+        for ac in queue[1:]:
+            hexcode = ac["hex"]
+            staged = self.staged.get(hexcode)
+            if hexcode in self.staging or (
+                    staged is not None and (now - staged[0]).total_seconds() < PRESTAGE_MAX_AGE_SECONDS):
+                continue
+            if self.pipeline.lockstep:
+                await self.stage(ac, now)
+            else:
+                self.staging[hexcode] = asyncio.create_task(self.stage(ac, now), name=f"prestage-{hexcode}")
+
+    async def stage(self, ac, now):
+        pipeline = self.pipeline
+        hexcode = ac["hex"]
+        try:
+            pending = pipeline.enrich_pending.get(hexcode)
+            if pending is not None:
+                await pending.wait()
+            fa_info = await pipeline.flightaware(ac, now)
+            ac = pipeline.aircraft_list.get(hexcode, ac)
+            staged_png = None
+            if self.stage_dir:
+                temperature_c = await pipeline.temperature(ac, now)
+                update_flight_timing(fa_info, now)
+                staged_json = os.path.join(self.stage_dir, f"{hexcode}.json")
+                staged_png = os.path.join(self.stage_dir, f"{hexcode}.png")
+                os.makedirs(self.stage_dir, exist_ok=True)
+                with open(staged_json, "w") as f:
+                    json.dump(self.build_alert(ac, fa_info, temperature_c, False), f)
+                with metrics.span("card_launch"):
+                    launch_card_renderer(staged_json, staged_png)
+            self.staged[hexcode] = (now, staged_png)
+            metrics.count("cards_prestaged")
+            self.log("prestage", hex=hexcode, flight=ac["flight"])
+        except Exception as e:
+            print(f"⚠️ Failed to pre-stage {hexcode}: {e}")
+        finally:
+            self.staging.pop(hexcode, None)
+
+    def take_staged(self, hexcode):
+        # The staged card for this aircraft, if card5 has finished rendering it
+        if hexcode not in self.staged:
+            return None
+        staged_png = self.staged[hexcode][1]
+        if staged_png is None or not os.path.exists(staged_png):
+            self.discard_staged(hexcode)
+            return None
+        del self.staged[hexcode]
+        return staged_png
+
+    def promote(self, staged_png, card_png):
+        try:
+            os.replace(staged_png, card_png)
+            os.utime(card_png)  # rendered a while ago; the refresh logic watches the mtime
+        except OSError as e:
+            print(f"⚠️ Failed to promote staged card {staged_png}: {e}")
+            return False
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(os.path.splitext(staged_png)[0] + ".json")
+        metrics.count("cards_promoted")
+        return True
+
+    def discard_staged(self, hexcode):
+        _, staged_png = self.staged.pop(hexcode)
+        if staged_png:
+            for path in (staged_png, os.path.splitext(staged_png)[0] + ".json"):
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+
+    def write_json(self):
+        if self.latest_alert is None or self.written_version == self.version:
+            return
+        self.written_version = self.version
+        with metrics.span("json_write"):
+            payload = json.dumps(self.latest_alert)
+            # Written aside and renamed, so card5 and the display never read a half-written file
+            path = self.site["alert_json"]
+            with open(path + ".tmp", 'w') as f:
+                f.write(payload)
+            os.replace(path + ".tmp", path)
+        metrics.count("bytes_written", len(payload))
+
+
+class AlertPipeline:
+    """main_loop as scan / enrich / alert / publish tasks joined by queues, for any number of sites.
+
+    With lockstep=True (replays) each stage finishes a tick before the next snapshot is read."""
+
+    def __init__(self, source, headless=False, lockstep=False, dashboard=None, live=None, snapshots=None,
+                 sites=None, fences=None):
+        self.source = source
+        self.headless = headless
+        self.lockstep = lockstep
+        self.dashboard = dashboard
+        self.live = live
+        self.snapshots = snapshots
+        self.sites = sites or default_sites()
+        self.site_lats = [site["lat"] for site in self.sites]
+        self.site_lons = [site["lon"] for site in self.sites]
+        self.site_bullseye_km = np.array([site["bullseye_alert_km"] for site in self.sites])
+        self.site_alerts = [SiteAlerts(self, site, i) for i, site in enumerate(self.sites)]
+        self.fences = GeofenceIndex(fences, self.sites) if fences else None
+        self.no_fences = ((), (False,) * len(self.sites))
+        self.aircraft_list = {}
+
+        self.enrich_queue = asyncio.Queue(maxsize=ENRICH_QUEUE_MAX)
+        self.enrich_pending = {}   # hex -> Event set once its lookup finished
+        self.enrich_deferred = []  # hexes that did not fit in the queue
+        self.alert_ticks = LatestQueue()
+        self.publish_ticks = LatestQueue()
+
+        # shared between sites
+        self.flightaware_fetched = {}  # hex -> when its FlightAware info was scraped
+        self.weather = {}              # hex -> (tick, temperature)
+
+    async def run(self):
+        tasks = [
+            asyncio.create_task(self.scan(), name="scan"),
+            asyncio.create_task(self.alerts(), name="alert"),
+            asyncio.create_task(self.publish(), name="publish"),
+        ]
+        tasks += [asyncio.create_task(self.enrich(), name=f"enrich-{i}") for i in range(ENRICH_WORKERS)]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()  # re-raise what stopped the stage (ReplayFinished ends a replay)
+        finally:
+            staging = [task for site in self.site_alerts for task in site.staging.values()]
+            for task in tasks + staging:
+                task.cancel()
+            await asyncio.gather(*tasks, *staging, return_exceptions=True)
+            for site in self.site_alerts:
+                for hexcode in list(site.staged):
+                    site.discard_staged(hexcode)
+
+    async def handoff(self, queue, item):
+        # lockstep: wait until the next stage is done with this tick
+        await queue.put(item)
+        await queue.join()
+
+    async def scan(self):
+        global within_schedule
+
+        aircraft_list = self.aircraft_list
+        while True:
+            metrics.begin_tick()
             try:
-                with open(AIRCRAFT_JSON_PATH) as f:
-                    data = json.load(f)
-            except Exception:
-                await asyncio.sleep(SCAN_INTERVAL_SECONDS)
+                with metrics.stage("ingest"):
+                    data = self.source()
+            except (OSError, ValueError):
+                metrics.count("ingest_errors")
+                metrics.end_tick()
+                await clock.sleep(SCAN_INTERVAL_SECONDS)
                 continue
 
-            now = datetime.utcnow()
+            now = clock.utcnow()
             seen_this_loop = set()
 
-            within_schedule = is_within_schedule(now)
+            schedule_now = is_within_schedule(now)
+            if self.headless and schedule_now != within_schedule:
+                log_event("schedule", state="open" if schedule_now else "closed")
+            within_schedule = schedule_now
             # Remove forced override; respect schedule as is
 
+            positions = []
             for ac in data.get("aircraft", []):
                 lat, lon, hexcode, flight = ac.get("lat"), ac.get("lon"), ac.get("hex"), ac.get("flight")
                 if lat is None or lon is None or flight is None or not hexcode:
                     continue
 
                 hexcode = hexcode.lower()
+                if hexcode in seen_this_loop:
+                    continue
                 seen_this_loop.add(hexcode)
-
-                if hexcode not in aircraft_list:
-                    adsb_info = lookup_adsbdb_info(hexcode) or {}
-                else:
-                    adsb_info = aircraft_list[hexcode].get("adsb", {})
-
-                distance_km = haversine(REFERENCE_LAT, REFERENCE_LON, lat, lon)
-
                 try:
                     heading = float(ac.get("track"))
-                    bullseye_km = closest_approach_distance(lat, lon, heading, REFERENCE_LAT, REFERENCE_LON)
                 except (TypeError, ValueError):
-                    heading = None
-                    bullseye_km = None
-
-                is_closing = (
-                    bullseye_km is not None
-                    and bullseye_km <= BULLSEYE_ALERT_KM
-                    and hexcode not in BLACKLISTED_HEX
-                )
-
-                prev_flightaware = aircraft_list.get(hexcode, {}).get("flightaware", {})
-
+                    heading = float("nan")
+                positions.append((hexcode, ac, lat, lon, heading))
+
+            lats = [p[2] for p in positions]
+            lons = [p[3] for p in positions]
+            headings = [p[4] for p in positions]
+            with metrics.stage("geometry"):
+                distances, bullseyes, along = site_geometry(lats, lons, headings, self.site_lats, self.site_lons)
+                closing = (bullseyes <= self.site_bullseye_km).tolist()
+                distances = distances.tolist()
+                bullseyes = np.where(np.isnan(bullseyes), None, bullseyes).tolist()
+                along = np.where(np.isnan(along), None, along).tolist()
+
+            fenced = {}  # position index -> ([fence names], [per-site hit])
+            if self.fences is not None:
+                with metrics.stage("geofence"):
+                    altitudes = [safe_float(p[1].get("alt_baro"), float("nan")) for p in positions]
+                    for a, f in self.fences.hits(lats, lons, headings, altitudes).T.tolist():
+                        names, site_fenced = fenced.setdefault(a, ([], [False] * len(self.sites)))
+                        names.append(self.fences.names[f])
+                        site_fenced[self.fences.sites[f]] = True
+
+            new_aircraft = []
+            for index, ((hexcode, ac, lat, lon, _), site_distance, site_bullseye, site_along, site_closing) in \
+                    enumerate(zip(positions, distances, bullseyes, along, closing)):
+                previous = aircraft_list.get(hexcode)
+                if previous is None:
+                    new_aircraft.append(hexcode)
+                    previous = {}
+                fence_names, site_fenced = fenced.get(index, self.no_fences)
+                if hexcode in BLACKLISTED_HEX:
+                    site_closing = site_fenced = self.no_fences[1]
+
+                # Top-level distance / bullseye / is_closing are the first site's (dashboard, snapshots)
                 aircraft_list[hexcode] = {
                     "hex": hexcode,
                     "flight": ac.get("flight", "").strip(),
                     "lat": lat,
                     "lon": lon,
-                    "distance": distance_km,
+                    "distance": site_distance[0],
                     "altitude": ac.get("alt_baro", "n/a"),
                     "speed": ac.get("gs", "n/a"),
                     "heading": ac.get("track", "n/a"),
-                    "adsb": adsb_info,
-                    "bullseye_km": bullseye_km,
-                    "is_closing": is_closing,
-                    "alerted": aircraft_list.get(hexcode, {}).get("alerted", False),
+                    "adsb": previous.get("adsb", {}),  # filled in by the enrich stage
+                    "bullseye_km": site_bullseye[0],
+                    "is_closing": site_closing[0],
+                    "site_distance": site_distance,
+                    "site_bullseye": site_bullseye,
+                    "site_along_km": site_along,
+                    "site_closing": site_closing,
+                    "site_fenced": site_fenced,
+                    "fences": fence_names,
+                    "alerted": previous.get("alerted", False),
                     "last_seen": now,
-                    "flightaware": prev_flightaware,
+                    "flightaware": previous.get("flightaware", {}),
                 }
 
+            # Known aircraft reuse their adsbdb info; new ones are queued for a lookup
+            metrics.count("aircraft_parsed", len(seen_this_loop))
+            metrics.count("cache_hits", len(seen_this_loop) - len(new_aircraft))
+
             # Prune old aircraft
             cutoff = now - timedelta(minutes=15)
             for hexcode in list(aircraft_list.keys()):
                 if hexcode not in seen_this_loop and aircraft_list[hexcode]["last_seen"] < cutoff:
+                    if self.headless:
+                        log_event("aircraft_lost", hex=hexcode, flight=aircraft_list[hexcode]["flight"])
                     del aircraft_list[hexcode]
+                    self.flightaware_fetched.pop(hexcode, None)
+                    self.weather.pop(hexcode, None)
                     gc.collect()
 
-            json_path = ALERT_JSON_FILE
-
-            matching_aircraft = [
-                ac for ac in aircraft_list.values()
-                if ac.get("flight")
-                and ac["distance"] is not None and ac["distance"] <= DISTANCE_ALERT_KM
-                and ac["is_closing"]
-            ]
-            matching_aircraft.sort(key=lambda x: x["distance"])
-
-            if matching_aircraft:
-                ac = matching_aircraft[0]
-                flight = ac["flight"]
-                hexcode = ac["hex"]
-
-                # Decide if starting a refresh cycle
-                start_refresh_cycle = False
-                if last_refresh_start is None:
-                    start_refresh_cycle = True
-                else:
-                    seconds_since_last_refresh_start = (now - last_refresh_start).total_seconds()
-                    if seconds_since_last_refresh_start >= MIN_ALERT_INTERVAL:
-                        start_refresh_cycle = True
-
-                if start_refresh_cycle:
-                    last_refresh_start = now
-                    refresh_ready = False
-                    refresh_ready_time = None
-                    last_png_mtime = get_mtime(png_path)
-
-                    try:
-                        fa_info = await scrape_flightaware(flight) if flight else {}
-                    except Exception:
-                        fa_info = {}
-                    gc.collect()
-                    aircraft_list[hexcode]["flightaware"] = fa_info
-
-                    temperature_c = get_temperature(ac["lat"], ac["lon"])
-                    current_temperature_c = temperature_c
-
-                    eta_minutes = None
-                    try:
-                        landing_time_str = fa_info.get("landing_time_estimated")
-                        if landing_time_str:
-                            landing_time = datetime.strptime(landing_time_str, "%Y-%m-%d %H:%M:%S UTC")
-                            eta_minutes = int((landing_time - now).total_seconds() / 60)
-                    except Exception:
-                        pass
-                    fa_info["eta_minutes"] = eta_minutes
-
-                    percent_complete = None
-                    try:
-                        actual_takeoff_str = fa_info.get("takeoff_time_actual")
-                        estimated_arrival_str = fa_info.get("arrival_time_estimated")
-                        if actual_takeoff_str and estimated_arrival_str:
-                            actual_takeoff = datetime.strptime(actual_takeoff_str, "%Y-%m-%d %H:%M:%S UTC")
-                            estimated_arrival = datetime.strptime(estimated_arrival_str, "%Y-%m-%d %H:%M:%S UTC")
-                            total_duration = (estimated_arrival - actual_takeoff).total_seconds()
-                            elapsed = (now - actual_takeoff).total_seconds()
-                            if total_duration > 0:
-                                percent_complete = max(0, min(100, (elapsed / total_duration) * 100))
-                    except Exception:
-                        percent_complete = None
-                    fa_info["percent_complete"] = percent_complete
-
-                    # Launch card5.py only if within_schedule is True
-                    subprocess.Popen([sys.executable, 'card5.py'],
-                                     stdout=subprocess.DEVNULL,
-                                     stderr=subprocess.DEVNULL)
-                    last_card_launch_time = last_refresh_start
+            await self.request_enrichment(new_aircraft)
 
-                else:
-                    fa_info = aircraft_list.get(hexcode, {}).get("flightaware", {}) or {}
-                    temperature_c = get_temperature(ac["lat"], ac["lon"])
-                    current_temperature_c = temperature_c
-
-                    eta_minutes = None
-                    try:
-                        landing_time_str = fa_info.get("landing_time_estimated")
-                        if landing_time_str:
-                            landing_time = datetime.strptime(landing_time_str, "%Y-%m-%d %H:%M:%S UTC")
-                            eta_minutes = int((landing_time - now).total_seconds() / 60)
-                    except Exception:
-                        pass
-                    fa_info["eta_minutes"] = eta_minutes
+            if self.lockstep:
+                await self.enrich_queue.join()
+                await self.handoff(self.alert_ticks, now)
+            else:
+                self.alert_ticks.put_latest(now)
+                self.publish_ticks.put_latest(now)  # dashboard keeps moving while alert is busy
+            metrics.end_tick()
+            await clock.sleep(SCAN_INTERVAL_SECONDS)
+
+    async def request_enrichment(self, hexcodes):
+        for hexcode in hexcodes:
+            self.enrich_pending[hexcode] = asyncio.Event()
+        if self.enrich_deferred:
+            hexcodes = self.enrich_deferred + hexcodes
+            self.enrich_deferred = []
+        for hexcode in hexcodes:
+            if hexcode not in self.aircraft_list:
+                self.enrich_pending.pop(hexcode).set()  # pruned before its turn came
+                continue
+            if self.lockstep:
+                await self.enrich_queue.put(hexcode)
+                continue
+            try:
+                self.enrich_queue.put_nowait(hexcode)
+            except asyncio.QueueFull:
+                self.enrich_deferred.append(hexcode)
 
-                    percent_complete = None
-                    try:
-                        actual_takeoff_str = fa_info.get("takeoff_time_actual")
-                        estimated_arrival_str = fa_info.get("arrival_time_estimated")
-                        if actual_takeoff_str and estimated_arrival_str:
-                            actual_takeoff = datetime.strptime(actual_takeoff_str, "%Y-%m-%d %H:%M:%S UTC")
-                            estimated_arrival = datetime.strptime(estimated_arrival_str, "%Y-%m-%d %H:%M:%S UTC")
-                            total_duration = (estimated_arrival - actual_takeoff).total_seconds()
-                            elapsed = (now - actual_takeoff).total_seconds()
-                            if total_duration > 0:
-                                percent_complete = max(0, min(100, (elapsed / total_duration) * 100))
-                    except Exception:
-                        percent_complete = None
-                    fa_info["percent_complete"] = percent_complete
+    async def enrich(self):
+        while True:
+            hexcode = await self.enrich_queue.get()
+            try:
+                metrics.count("enrichments_started")
+                with metrics.span("adsbdb"):
+                    adsb_info = await asyncio.to_thread(lookup_adsbdb_info, hexcode) or {}
+                ac = self.aircraft_list.get(hexcode)
+                if ac is not None:
+                    ac["adsb"] = adsb_info
+                    if self.headless:
+                        log_event("new_aircraft", hex=hexcode, flight=ac["flight"],
+                                  registration=adsb_info.get("registration"), dist_km=ac["distance"])
+            finally:
+                self.enrich_pending.pop(hexcode).set()
+                self.enrich_queue.task_done()
+
+    async def flightaware(self, ac, now):
+        # One scrape per aircraft per MIN_ALERT_INTERVAL, however many sites are alerting on it
+        hexcode = ac["hex"]
+        fetched = self.flightaware_fetched.get(hexcode)
+        if fetched is not None and (now - fetched).total_seconds() < MIN_ALERT_INTERVAL:
+            return ac.get("flightaware") or {}
+
+        metrics.count("enrichments_started")
+        try:
+            with metrics.span("flightaware"):
+                fa_info = await scrape_flightaware(ac["flight"]) if ac["flight"] else {}
+        except Exception:
+            fa_info = {}
+        fa_info = fa_info or {}
+        gc.collect()
+        self.flightaware_fetched[hexcode] = now
+        self.aircraft_list.get(hexcode, ac)["flightaware"] = fa_info
+        return fa_info
+
+    async def temperature(self, ac, now):
+        # Weather at the aircraft, fetched once per tick whichever sites need it
+        cached = self.weather.get(ac["hex"])
+        if cached is not None and cached[0] == now:
+            return cached[1]
+        with metrics.span("weather"):
+            temperature_c = await asyncio.to_thread(get_temperature, ac["lat"], ac["lon"])
+        self.weather[ac["hex"]] = (now, temperature_c)
+        return temperature_c
+
+    async def alerts(self):
+        global latest_alert, current_temperature_c
 
-            else:
-                ac = None
-                fa_info = {}
-                flight = None
-                temperature_c = current_temperature_c  # maintain previous temperature or None
-
-            # Determine refresh_flag only if within_schedule and aircraft present
-            refresh_flag = False
-            if within_schedule and ac:
-                if flight != last_alerted_flight:
-                    current_png_mtime = get_mtime(png_path)
-                    if not refresh_ready and current_png_mtime > last_png_mtime:
-                        refresh_ready = True
-                        refresh_ready_time = now
-                    if refresh_ready and refresh_ready_time is not None:
-                        elapsed_ms = (now - refresh_ready_time).total_seconds() * 1000.0
-                        if elapsed_ms <= REFRESH_DURATION_MS:
-                            refresh_flag = True
-                            last_alerted_flight = flight
-                        else:
-                            refresh_ready = False
-                            refresh_ready_time = None
+        while True:
+            now = await self.alert_ticks.get()
+            try:
+                for site_alerts in self.site_alerts:
+                    await site_alerts.evaluate(now)
+                # The dashboard and snapshots show the first site
+                latest_alert = self.site_alerts[0].latest_alert
+                current_temperature_c = self.site_alerts[0].temperature_c
+                if self.lockstep:
+                    await self.handoff(self.publish_ticks, now)
                 else:
-                    refresh_flag = False
-            else:
-                last_alerted_flight = None
-
-            latest_alert = {
-                "display": within_schedule,
-                "refresh": refresh_flag,
-                "refreshInterval": 10000,
-                "png_url": "http://192.168.0.105:8080/flight_card.png" if within_schedule and ac else "",
-                "flight": flight or "",
-                "aircraft_info": ac["adsb"] if ac else {},
-                "flight_info": fa_info,
-                "eta_minutes": fa_info.get("eta_minutes") if fa_info else None,
-                "speed": ac.get("speed") if ac else None,
-                "heading": ac.get("heading") if ac else None,
-                "altitude": ac.get("altitude") if ac else None,
-                "bullseye_km": ac.get("bullseye_km") if ac else None,
-                "flight_progress": 100 - (fa_info.get("distance_remaining_nm", 0) /
-                                          max((fa_info.get("distance_elapsed_nm", 1) +
-                                               fa_info.get("distance_remaining_nm", 0)), 1)) * 100
-                                    if fa_info.get("distance_remaining_nm") and fa_info.get("distance_elapsed_nm") else 0,
-                "departure_time_actual": fa_info.get("departure_time_actual"),
-                "arrival_time_estimated": fa_info.get("arrival_time_estimated"),
-                "percent_complete": fa_info.get("percent_complete"),
-                "temperature_c": temperature_c,
-            }
+                    self.publish_ticks.put_latest(now)
+            finally:
+                self.alert_ticks.task_done()
 
-            with open(json_path, 'w') as f:
-                json.dump(latest_alert, f)
+    async def publish(self):
+        while True:
+            await self.publish_ticks.get()
+            try:
+                self.write_outputs()
+            finally:
+                self.publish_ticks.task_done()
+
+    def write_outputs(self):
+        for site_alerts in self.site_alerts:
+            site_alerts.write_json()
+
+        if self.dashboard is not None:
+            with metrics.span("dashboard"):
+                view = self.dashboard.render(self.aircraft_list, latest_alert, within_schedule,
+                                             current_temperature_c)
+                if view is not None:
+                    self.live.update(view)
+        if self.snapshots is not None:
+            with metrics.span("publish"):
+                self.snapshots.publish(self.aircraft_list, latest_alert, within_schedule, current_temperature_c)
+
+
+async def main_loop(headless=False, socket_path=None, source=read_aircraft_json, lockstep=False, sites=None,
+                    fences=None):
+    # Headless: no rich at all, only logfmt transition lines (and an optional snapshot socket)
+    snapshots = None
+    if socket_path:
+        snapshots = SnapshotServer(socket_path)
+        await snapshots.start()
+    if (not headless or snapshots) and not system_stats.is_alive():
+        system_stats.start()
+    if headless:
+        dashboard = None
+        display = contextlib.nullcontext()
+    else:
+        from rich.live import Live
 
-            if ac:
-                aircraft_list[ac["hex"]]["alerted"] = True
+        dashboard = DashboardModel()
+        display = Live(dashboard.render({}, latest_alert, within_schedule, force=True),
+                       refresh_per_second=1, screen=True)
 
-            spinner_index = (spinner_index + 1) % len(spinner_frames)
-            spinner_frame = spinner_frames[spinner_index]
-            live.update(render_dashboard(aircraft_list, latest_alert, spinner_frame, within_schedule, current_temperature_c))
-            await asyncio.sleep(SCAN_INTERVAL_SECONDS)
+    with display as live, contextlib.closing(snapshots) if snapshots else contextlib.nullcontext():
+        pipeline = AlertPipeline(source, headless=headless, lockstep=lockstep, dashboard=dashboard, live=live,
+                                 snapshots=snapshots, sites=sites, fences=fences)
+        await pipeline.run()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ADS-B flight alerts")
+    parser.add_argument("--headless", action="store_true",
+                        help="no dashboard (rich is never imported); log state transitions as logfmt lines")
+    parser.add_argument("--socket", metavar="PATH",
+                        help="serve dashboard snapshots on this unix socket for --attach")
+    parser.add_argument("--attach", metavar="PATH",
+                        help="show the dashboard of an instance running with --socket PATH")
+    parser.add_argument("--sites", metavar="PATH",
+                        help="JSON list of reference sites to alert for (default: the home site)")
+    parser.add_argument("--fences", metavar="PATH",
+                        help="JSON list of polygon geofences (approach corridors, runway centrelines)")
+    parser.add_argument("--metrics", metavar="DIR",
+                        help=f"time each scan stage; write alert18.prom and alert18_metrics.json to DIR "
+                             f"every {METRICS_EXPORT_SECONDS}s")
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable(args.metrics)
     try:
-        asyncio.run(main_loop())
+        if args.attach:
+            asyncio.run(attach(args.attach))
+        else:
+            sites = load_sites(args.sites) if args.sites else None
+            fences = load_fences(args.fences) if args.fences else None
+            asyncio.run(main_loop(headless=args.headless, socket_path=args.socket, sites=sites, fences=fences))
     except KeyboardInterrupt:
         print("\nExiting...")
+    finally:
+        metrics.export()
 
 
 
@@ -0,0 +1,424 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+# Benchmarks for the hot paths, on reproducible synthetic fixtures. Run from the repo directory
+# (card5 loads its shape/font files relative to it).
+#
+#   python bench_suite.py                          # everything, results in bench_results/
+#   python bench_suite.py --only scan_tick --sizes 100 1000
+#   python bench_suite.py --quick --out pi-before.json
+#
+# Fixtures (seeded, regenerated only when missing) live in --fixtures:
+#   aircraft_<n>.json   dump1090-style snapshots with n aircraft around the reference point
+#   alerts.ndjson       alert dicts as alert18 writes them (also usable with card_batch.py)
+#   flights_stats.db    flight_events + rollups in the current top10final schema
+#
+# Every benchmark reports per-operation times in ms (mean, median, p95, min) and ops/s,
+# together with host/commit metadata, as one JSON document, so runs on the Pi can be
+# diffed over time.
+
+FIXTURE_DIR = "bench_fixtures"
+RESULTS_DIR = "bench_results"
+FLEET_SIZES = [10, 100, 1000, 5000]
+DB_ROWS = 100_000
+REPEAT = 5
+SEED = 1234
+
+# Virtual time for the scan benchmarks: a July weekday evening, inside the publishing schedule
+BENCH_EPOCH = datetime(2025, 7, 16, 0, 0, tzinfo=timezone.utc).timestamp()
+SHAPE_DESIGNATORS = ["A320", "B738", "DH8D", "B77W", "A21N", "B789", "CRJ9", "A333"]
+
+
+def fleet_snapshot(count, seed=SEED):
+    import alert18
+
+    rng = random.Random(seed + count)
+    aircraft = []
+    for i in range(count):
+        aircraft.append({
+            "hex": f"{rng.randrange(16 ** 6):06x}",
+            "flight": f"{rng.choice(['ACA', 'WJA', 'POE', 'UAL', 'DAL', 'JZA'])}{rng.randrange(1, 9999)} ",
+            "lat": alert18.REFERENCE_LAT + rng.uniform(-2.5, 2.5),
+            "lon": alert18.REFERENCE_LON + rng.uniform(-3.5, 3.5),
+            "track": round(rng.uniform(0, 360), 1),
+            "alt_baro": rng.randrange(1000, 41000, 25),
+            "gs": round(rng.uniform(120, 520), 1),
+        })
+    # A few aircraft on short final over the reference point, so alert paths are exercised
+    for i in range(min(3, count)):
+        aircraft[i].update(lat=alert18.REFERENCE_LAT - 0.03 * (i + 1), lon=alert18.REFERENCE_LON, track=0.0)
+    return {"now": BENCH_EPOCH, "messages": count * 100, "aircraft": aircraft}
+
+
+def sample_alerts(count=20, seed=SEED):
+    rng = random.Random(seed)
+    now = datetime.fromtimestamp(BENCH_EPOCH, timezone.utc)
+    fmt = "%Y-%m-%d %H:%M:%S UTC"
+    alerts = []
+    for i in range(count):
+        takeoff = now - timedelta(minutes=rng.randrange(20, 400))
+        arrival = now + timedelta(minutes=rng.randrange(-5, 60))
+        designator = SHAPE_DESIGNATORS[i % len(SHAPE_DESIGNATORS)]
+        alerts.append({
+            "display": True,
+            "refresh": False,
+            "flight": f"{rng.choice(['ACA', 'WJA', 'POE'])}{rng.randrange(1, 999)}",
+            "aircraft_info": {
+                "type": f"Synthetic {designator}",
+                "icao_type": designator,
+                "manufacturer": rng.choice(["Airbus", "Boeing", "De Havilland", "Bombardier"]),
+                "registration": f"C-{''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(4))}",
+                "operator": rng.choice(["Air Canada", "WestJet", "Porter"]),
+                "country": "Canada",
+            },
+            "flight_info": {
+                "origin": "Vancouver, BC", "origin_iata": "YVR",
+                "destination": "Toronto, ON", "destination_iata": "YYZ",
+                "takeoff_time_actual": takeoff.strftime(fmt),
+                "arrival_time_estimated": arrival.strftime(fmt),
+            },
+            "speed": round(rng.uniform(140, 480), 1),
+            "heading": round(rng.uniform(0, 360), 1),
+            "altitude": rng.randrange(1500, 12000, 25),
+            "bullseye_km": round(rng.uniform(0, 1.4), 2),
+            "temperature_c": round(rng.uniform(-5, 30), 1),
+        })
+    return alerts
+
+
+def build_stats_db(path, rows):
+    import top10final
+
+    conn = top10final.connect_db(path)
+    top10final.init_db(conn)
+    with conn:
+        conn.executemany(top10final.INSERT_EVENT_SQL, top10final.synthetic_events(rows, seed=SEED))
+    top10final.rebuild_rollups(conn)
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def ensure_fixtures(fixture_dir, sizes, db_rows):
+    os.makedirs(fixture_dir, exist_ok=True)
+    for n in sizes:
+        path = os.path.join(fixture_dir, f"aircraft_{n}.json")
+        if not os.path.exists(path):
+            with open(path, "w") as f:
+                json.dump(fleet_snapshot(n), f)
+    path = os.path.join(fixture_dir, "alerts.ndjson")
+    if not os.path.exists(path):
+        with open(path, "w") as f:
+            for alert in sample_alerts():
+                f.write(json.dumps(alert) + "\n")
+    path = os.path.join(fixture_dir, f"flights_stats_{db_rows}.db")
+    if not os.path.exists(path):
+        print(f"Building {path} ({db_rows:,} rows) ...")
+        build_stats_db(path, db_rows)
+
+
+def measure(fn, repeat=REPEAT, number=1, setup=None):
+    # Per-call times (ms) over `repeat` samples of `number` calls each, after one warm-up call
+    if setup:
+        setup()
+    fn()
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) * 1000 / number)
+    samples.sort()
+    mean = statistics.fmean(samples)
+    return {
+        "mean_ms": round(mean, 4),
+        "median_ms": round(statistics.median(samples), 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))], 4),
+        "min_ms": round(samples[0], 4),
+        "ops_per_s": round(1000 / mean, 1) if mean else None,
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def bench_geometry(results, repeat):
+    import alert18
+
+    rng = random.Random(SEED)
+    points = [(alert18.REFERENCE_LAT + rng.uniform(-2, 2), alert18.REFERENCE_LON + rng.uniform(-3, 3),
+               rng.uniform(0, 360)) for _ in range(1000)]
+
+    def haversine():
+        for lat, lon, _ in points:
+            alert18.haversine(alert18.REFERENCE_LAT, alert18.REFERENCE_LON, lat, lon)
+
+    def closest():
+        for lat, lon, track in points:
+            alert18.closest_approach_distance(lat, lon, track, alert18.REFERENCE_LAT, alert18.REFERENCE_LON)
+
+    # Reported per call: each sample runs the function over 1000 points
+    for name, fn in (("haversine", haversine), ("closest_approach_distance", closest)):
+        stats = measure(fn, repeat, number=10)
+        for key in ("mean_ms", "median_ms", "p95_ms", "min_ms"):
+            stats[key] = round(stats[key] / len(points), 6)
+        stats["ops_per_s"] = round(stats["ops_per_s"] * len(points), 1)
+        results.append({"name": name, "params": {}, **stats})
+
+
+def synthetic_fences(count, seed=SEED):
+    import alert18
+    import shapely
+
+    # Small quadrilateral corridors scattered over the fleet area
+    rng = random.Random(seed + count)
+    fences = []
+    for i in range(count):
+        lat = alert18.REFERENCE_LAT + rng.uniform(-2.5, 2.5)
+        lon = alert18.REFERENCE_LON + rng.uniform(-3.5, 3.5)
+        w, h = rng.uniform(0.01, 0.08), rng.uniform(0.05, 0.2)
+        fences.append({"name": f"fence{i}", "site": None, "max_altitude_ft": None,
+                       "geometry": shapely.Polygon([(lat, lon), (lat + h, lon + w / 2), (lat + h, lon + w),
+                                                    (lat, lon + w / 2)])})
+    return fences
+
+
+def bench_geofence(results, repeat, aircraft=1000, counts=(1, 10, 100, 1000)):
+    import alert18
+
+    fleet = fleet_snapshot(aircraft)["aircraft"]
+    lats = [ac["lat"] for ac in fleet]
+    lons = [ac["lon"] for ac in fleet]
+    headings = [ac["track"] for ac in fleet]
+    altitudes = [ac["alt_baro"] for ac in fleet]
+    sites = alert18.default_sites()
+    for count in counts:
+        index = alert18.GeofenceIndex(synthetic_fences(count), sites)
+        hits = index.hits(lats, lons, headings, altitudes).shape[1]
+        results.append({"name": "geofence_hits", "params": {"aircraft": aircraft, "fences": count, "hits": hits},
+                        **measure(lambda: index.hits(lats, lons, headings, altitudes), repeat, number=10)})
+
+
+def bench_scan(results, fixture_dir, sizes, repeat, ticks=5):
+    import alert18
+    import replay
+
+    out_dir = os.path.join(fixture_dir, "out")
+    os.makedirs(out_dir, exist_ok=True)
+    replay.stub_enrichment(alert18, out_dir)
+    alert18.log_event = lambda event, **fields: None
+
+    for n in sizes:
+        with open(os.path.join(fixture_dir, f"aircraft_{n}.json")) as f:
+            snapshot = json.load(f)
+
+        def run():
+            clock = replay.ReplayClock(speed=0)
+            alert18.clock = clock
+            source = replay.ReplaySource(
+                ({"t": BENCH_EPOCH + i, "data": snapshot} for i in range(ticks)), clock)
+            with contextlib.suppress(replay.ReplayFinished):
+                asyncio.run(alert18.main_loop(headless=True, source=source, lockstep=True))
+
+        stats = measure(run, repeat)
+        for key in ("mean_ms", "median_ms", "p95_ms", "min_ms"):
+            stats[key] = round(stats[key] / ticks, 4)
+        stats["ops_per_s"] = round(stats["ops_per_s"] * ticks, 1)
+        results.append({"name": "scan_tick", "params": {"aircraft": n, "ticks_per_run": ticks}, **stats})
+
+
+def bench_dashboard(results, sizes, repeat):
+    import alert18
+    from rich.console import Console
+
+    console = Console(file=io.StringIO(), width=160, force_terminal=True)
+    rng = random.Random(SEED)
+    for n in sizes:
+        aircraft_list = {}
+        for ac in fleet_snapshot(n)["aircraft"]:
+            aircraft_list[ac["hex"]] = {
+                "hex": ac["hex"], "flight": ac["flight"].strip(), "lat": ac["lat"], "lon": ac["lon"],
+                "distance": alert18.haversine(alert18.REFERENCE_LAT, alert18.REFERENCE_LON, ac["lat"], ac["lon"]),
+                "altitude": ac["alt_baro"], "speed": ac["gs"], "heading": ac["track"], "adsb": {},
+                "bullseye_km": rng.uniform(0, 50), "is_closing": False, "alerted": False, "flightaware": {},
+            }
+        alert = sample_alerts(1)[0]
+
+        def full():
+            console.file = io.StringIO()
+            console.print(alert18.render_dashboard(aircraft_list, alert, "⠋", True, 12.0))
+
+        model = alert18.DashboardModel()
+
+        def incremental():
+            console.file = io.StringIO()
+            console.print(model.render(aircraft_list, alert, True, 12.0, force=True))
+
+        results.append({"name": "render_dashboard", "params": {"aircraft": n}, **measure(full, repeat)})
+        results.append({"name": "dashboard_model", "params": {"aircraft": n}, **measure(incremental, repeat)})
+
+
+def bench_card(results, fixture_dir, repeat):
+    import card5
+
+    out_dir = os.path.join(fixture_dir, "out")
+    os.makedirs(out_dir, exist_ok=True)
+    card5.PNG_PATH = os.path.join(out_dir, "flight_card.png")
+    card5.FRAMEBUFFER_PATH = os.path.join(out_dir, "flight_card.bin")
+    card5.PREVIEW_PATH = os.path.join(out_dir, "flight_card_preview.png")
+    card5.REFRESH_JSON_PATH = os.path.join(out_dir, "flight_card_refresh.json")
+    card5.REFRESH_STATE_PATH = os.path.join(out_dir, "refresh_state.json")
+    card5.CARD_CACHE_DIR = os.path.join(out_dir, "card_cache")
+    card5.CARD_CACHE_STATS_PATH = os.path.join(out_dir, "card_cache_stats.json")
+
+    with open(os.path.join(fixture_dir, "alerts.ndjson")) as f:
+        alerts = [json.loads(line) for line in f if line.strip()]
+    alerts_iter = iter([])
+
+    def next_alert():
+        nonlocal alerts_iter
+        alert = next(alerts_iter, None)
+        if alert is None:
+            alerts_iter = iter(alerts)
+            alert = next(alerts_iter)
+        return alert
+
+    cases = [
+        ("png", {"output": "png", "use_cache": False}),
+        ("png_cached", {"output": "png", "use_cache": True}),
+        ("eink", {"output": "eink", "use_cache": False}),
+        ("eink_dither", {"output": "eink", "dither": True, "use_cache": False}),
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for label, kwargs in cases:
+            alert = alerts[0]
+            fn = (lambda: card5.process_flight_data(alert, **kwargs)) if kwargs.get("use_cache") else \
+                (lambda: card5.process_flight_data(next_alert(), **kwargs))
+            results.append({"name": "card5.process_flight_data", "params": {"case": label},
+                            **measure(fn, repeat, number=len(alerts) if label != "png_cached" else 20)})
+
+        df = card5.get_shape_df()
+        for designator in SHAPE_DESIGNATORS[:4]:
+            results.append({"name": "card5.render_shape", "params": {"designator": designator},
+                            **measure(lambda: card5.render_shape(designator, designator, rotation=37, df=df), repeat)})
+
+
+def check_top10_plans(top10final):
+    # today/week must range-scan the (dimension, day) rollup index, not walk every day of a dimension
+    now = datetime.now(timezone.utc)
+    for period in ("today", "week"):
+        for dimension in top10final.ROLLUP_DIMENSIONS:
+            sql, params = top10final.rollup_source(period, dimension, top10final.period_start(period, now))
+            plan = [row[3] for row in top10final.db.reader.execute(
+                f"EXPLAIN QUERY PLAN SELECT value, label, SUM(cnt) FROM ({sql}) GROUP BY value, label", params)]
+            if not any("flight_rollups USING INDEX idx_rollups_dimension" in step for step in plan):
+                raise AssertionError(f"query_top_10({period!r}) {dimension} plan regressed: {plan}")
+
+
+def bench_top10(results, fixture_dir, db_rows, repeat):
+    import top10final
+
+    top10final.db = top10final.FlightDB(os.path.join(fixture_dir, f"flights_stats_{db_rows}.db"))
+    try:
+        check_top10_plans(top10final)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for period in top10final.PERIODS:
+                results.append({"name": "query_top_10", "params": {"period": period, "rows": db_rows},
+                                **measure(lambda: top10final.query_top_10(period), repeat)})
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            top10final.db.close()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+
+BENCHMARKS = ["geometry", "geofence", "scan_tick", "dashboard", "card", "top10"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the alert/card/stats hot paths")
+    parser.add_argument("--fixtures", default=FIXTURE_DIR, help=f"fixture directory (default {FIXTURE_DIR})")
+    parser.add_argument("--out", help=f"result JSON path (default {RESULTS_DIR}/bench-<host>-<time>.json)")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="run only these benchmark groups")
+    parser.add_argument("--sizes", nargs="+", type=int, default=FLEET_SIZES, help="fleet sizes (aircraft)")
+    parser.add_argument("--db-rows", type=int, default=DB_ROWS, help="rows in the synthetic stats DB")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="samples per benchmark")
+    parser.add_argument("--quick", action="store_true", help="3 samples, fleets up to 1,000, 20k-row DB")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.repeat = 3
+        args.sizes = [n for n in args.sizes if n <= 1000]
+        args.db_rows = min(args.db_rows, 20_000)
+    groups = args.only or BENCHMARKS
+
+    ensure_fixtures(args.fixtures, args.sizes, args.db_rows)
+
+    results = []
+    started = time.perf_counter()
+    for group in groups:
+        print(f"▶ {group}")
+        group_started = len(results)
+        if group == "geometry":
+            bench_geometry(results, args.repeat)
+        elif group == "geofence":
+            bench_geofence(results, args.repeat)
+        elif group == "scan_tick":
+            bench_scan(results, args.fixtures, args.sizes, args.repeat)
+        elif group == "dashboard":
+            bench_dashboard(results, args.sizes, args.repeat)
+        elif group == "card":
+            bench_card(results, args.fixtures, args.repeat)
+        elif group == "top10":
+            bench_top10(results, args.fixtures, args.db_rows, args.repeat)
+        for r in results[group_started:]:
+            params = " ".join(f"{k}={v}" for k, v in r["params"].items())
+            print(f"  {r['name']:<28} {params:<32} median {r['median_ms']:>10.4f} ms  p95 {r['p95_ms']:>10.4f} ms")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "host": socket.gethostname(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "commit": git_commit(),
+            "repeat": args.repeat,
+            "fleet_sizes": args.sizes,
+            "db_rows": args.db_rows,
+            "seconds": round(time.perf_counter() - started, 1),
+        },
+        "results": results,
+    }
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(RESULTS_DIR, f"bench-{socket.gethostname()}-{stamp}.json")
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
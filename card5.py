@@ -1,21 +1,62 @@
 import json
 import io
 import math
+import os
+import sys
+import time
+import hashlib
 from datetime import datetime, timezone
+from functools import lru_cache
 from html import escape
-from PIL import Image, ImageDraw, ImageFont
-import cairosvg
-from svgpathtools import parse_path
-from rapidfuzz import process, fuzz
-import pandas as pd
+
+# card5 is started as a fresh process for every alert, so startup time is alert latency.
+# pandas, svgpathtools, rapidfuzz, PIL and numpy (plus cairosvg for SHAPE_RASTERIZER="cairo")
+# are imported inside the functions that need them; a PNG cache hit never loads any of them.
+# `python card5.py --importtime` / `--startup-bench` measure this (see report_import_times).
 
 WIDTH = 384
 HEIGHT = 184
 
 CARD_JSON_FILE = "/usr/share/skyaware/html/flight_card.html"
 PNG_PATH = "/usr/share/skyaware/html/flight_card.png"
-
-SHAPE_DF = pd.read_csv('shape_data.csv', delimiter='\t')
+# Panel framebuffer (--eink): WIDTH x HEIGHT, row-major, 2 bits per pixel packed 4 pixels to a byte,
+# leftmost pixel in the high bits; codes are PANEL_COLORS indices (black 0, white 1, yellow 2, red 3),
+# the 4-colour panels' native layout, so the display blits it as is (see pack_2bit)
+FRAMEBUFFER_PATH = "/usr/share/skyaware/html/flight_card.bin"
+PREVIEW_PATH = "/usr/share/skyaware/html/flight_card_preview.png"
+REFRESH_JSON_PATH = "/usr/share/skyaware/html/flight_card_refresh.json"
+REFRESH_STATE_PATH = "/usr/share/skyaware/html/flight_card_refresh_state.json"
+
+# On-disk LRU of rendered cards, keyed by a hash of the fields that affect pixels
+CARD_CACHE_DIR = "/usr/share/skyaware/html/card_cache"
+CARD_CACHE_STATS_PATH = "/usr/share/skyaware/html/card_cache_stats.json"
+CARD_CACHE_MAX_ENTRIES = 500
+CARD_CACHE_MAX_BYTES = 32 * 1024 * 1024
+CARD_CACHE_VERSION = 1  # bump when the card layout, fonts or logos change
+
+LOGO_DIR = "./operator_logos/airline-logos/radarbox_logos"
+CARD_FONTS = [
+    ("./Anton-Regular.ttf", 50),
+    ("./Anton-Regular.ttf", 85),
+    ("./Anton-Regular.ttf", 16),
+    ("./Roboto-Medium.ttf", 12),
+    ("./Roboto_Condensed-SemiBold.ttf", 18),
+]
+
+SHAPE_CSV = "shape_data.csv"
+VERBOSE = True  # per-card shape-match lines; card_batch -q turns them off
+SHAPE_DF = None  # loaded on first use by get_shape_df()
+
+# Startup budget for `import card5` on top of bare interpreter startup, checked by --startup-bench
+STARTUP_BUDGET_MS = 60
+STARTUP_BENCH_RUNS = 10
+
+# Aircraft silhouette: "polygon" fills the sampled path directly at SHAPE_SIZE,
+# "cairo" is the old SVG -> cairosvg 800x800 PNG -> thumbnail path
+SHAPE_RASTERIZER = "polygon"
+SHAPE_SIZE = 100
+SHAPE_SUPERSAMPLE = 4
+SHAPE_CURVE_SAMPLES = 8   # points per curve/arc segment when flattening paths
 
 PALETTE = {
     "black": (0, 0, 0),
@@ -25,8 +66,60 @@ PALETTE = {
     "transparent": (0, 0, 0, 0)
 }
 
+# Panel colour order: index i is written as the 2-bit code i in the framebuffer
+PANEL_COLORS = ["black", "white", "yellow", "red"]
+PANEL_RGB = [PALETTE[name] for name in PANEL_COLORS]
+
+# 4x4 Bayer matrix, normalised to -0.5..0.5, for ordered dithering
+BAYER_4X4 = [
+    [(v + 0.5) / 16 - 0.5 for v in row]
+    for row in ([0, 8, 2, 10], [12, 4, 14, 6], [3, 11, 1, 9], [15, 7, 13, 5])
+]
+DITHER_STRENGTH = 64
+
+# Partial refresh tuning
+DIRTY_TILE = 8                 # dirty rects are aligned to 8 px tiles (panel window granularity)
+DIRTY_MERGE_GAP = 1            # dirty tiles this many tiles apart end up in the same rect
+MAX_DIRTY_RECTS = 8            # more rects than this collapse into one bounding rect
+FULL_REFRESH_AREA = 0.4        # changed fraction of the screen above which a full refresh is cheaper
+GHOSTING_BUDGET = 2.0          # accumulated partial-refresh area (in screens) before forcing a full refresh
+MAX_PARTIAL_REFRESHES = 12     # partial refreshes in a row before forcing a full refresh
+
+def get_shape_df():
+    global SHAPE_DF
+    if SHAPE_DF is None:
+        import pandas as pd
+        SHAPE_DF = pd.read_csv(SHAPE_CSV, delimiter='\t')
+    return SHAPE_DF
+
 def get_path_bounds(path_str):
+    from svgpathtools import parse_path
+
+    return path_bounds(parse_path(path_str))
+
+@lru_cache(maxsize=64)
+def sample_path(path_str, curve_samples=None):
+    # Flatten an SVG path into one closed polygon per subpath (complex x+yj points) plus its
+    # bounds. Parsed and sampled once per shape, every later render only transforms the points.
+    import numpy as np
+    from svgpathtools import parse_path, Line
+
+    curve_samples = curve_samples or SHAPE_CURVE_SAMPLES
     path = parse_path(path_str)
+    polygons = []
+    for subpath in path.continuous_subpaths():
+        points = []
+        for seg in subpath:
+            if isinstance(seg, Line):
+                points.append(seg.start)
+            else:
+                points.extend(seg.point(t) for t in np.linspace(0, 1, curve_samples, endpoint=False))
+        if len(points) >= 3:
+            polygons.append(np.array(points, dtype=np.complex128))
+
+    return polygons, path_bounds(path)
+
+def path_bounds(path):
     xmin, xmax, ymin, ymax = None, None, None, None
     for seg in path:
         box = seg.bbox()
@@ -40,23 +133,121 @@ def get_path_bounds(path_str):
             ymax = box[3]
     return xmin, xmax, ymin, ymax
 
-def render_shape(designator, type, rotation=0, use_accent=False, base_color="black", df=SHAPE_DF):
+def shape_matrix(bounds, rotation, size):
+    # 3x3 affine: rotate about the bounds centre (SVG rotate(), y down), then fit the bounds
+    # into a size x size square, centred, like an SVG viewBox with the default "meet"
+    import numpy as np
+
+    xmin, xmax, ymin, ymax = bounds
+    cx, cy = (xmin + xmax) / 2, (ymin + ymax) / 2
+    theta = math.radians(rotation)
+    cos_t, sin_t = math.cos(theta), math.sin(theta)
+    rotate = np.array([
+        [cos_t, -sin_t, cx - cx * cos_t + cy * sin_t],
+        [sin_t, cos_t, cy - cx * sin_t - cy * cos_t],
+        [0, 0, 1],
+    ])
+    width, height = xmax - xmin, ymax - ymin
+    scale = size / max(width, height)
+    fit = np.array([
+        [scale, 0, -xmin * scale + (size - width * scale) / 2],
+        [0, scale, -ymin * scale + (size - height * scale) / 2],
+        [0, 0, 1],
+    ])
+    return fit @ rotate
+
+def fill_polygons(polygons, matrix, width, height, row_chunk=64):
+    # Scanline fill with SVG's nonzero winding rule at pixel centres, returns a bool mask
+    import numpy as np
+
+    pts = [np.stack([p.real, p.imag, np.ones(len(p))]) for p in polygons]
+    pts = [(matrix @ p)[:2] for p in pts]
+    x0 = np.concatenate([p[0] for p in pts])
+    y0 = np.concatenate([p[1] for p in pts])
+    x1 = np.concatenate([np.roll(p[0], -1) for p in pts])
+    y1 = np.concatenate([np.roll(p[1], -1) for p in pts])
+
+    keep = y0 != y1  # horizontal edges never cross a scanline
+    x0, y0, x1, y1 = x0[keep], y0[keep], x1[keep], y1[keep]
+    lo, hi = np.minimum(y0, y1), np.maximum(y0, y1)
+    inv_slope = (x1 - x0) / (y1 - y0)
+    direction = np.where(y1 > y0, 1, -1)
+
+    mask = np.zeros((height, width), dtype=bool)
+    for row0 in range(0, height, row_chunk):
+        ys = np.arange(row0, min(row0 + row_chunk, height)) + 0.5
+        crosses = (ys[:, None] >= lo) & (ys[:, None] < hi)
+        xs = np.where(crosses, x0 + (ys[:, None] - y0) * inv_slope, np.inf)
+        order = np.argsort(xs, axis=1)
+        xs = np.take_along_axis(xs, order, axis=1)
+        winding = np.cumsum(np.where(np.isfinite(xs), direction[order], 0), axis=1)
+
+        # the span between crossing k and k+1 is inside when the winding number there is non-zero
+        rows, k = np.nonzero((winding[:, :-1] != 0) & np.isfinite(xs[:, 1:]))
+        start = np.clip(np.ceil(xs[rows, k] - 0.5), 0, width).astype(np.int64)
+        end = np.clip(np.ceil(xs[rows, k + 1] - 0.5), 0, width).astype(np.int64)
+        diff = np.zeros((len(ys), width + 1), dtype=np.int32)
+        np.add.at(diff, (rows, start), 1)
+        np.add.at(diff, (rows, end), -1)
+        mask[row0:row0 + len(ys)] = np.cumsum(diff[:, :width], axis=1) > 0
+    return mask
+
+def rasterize_shape(path_data, rotation=0, size=None, base_color="black", accent_data=None, supersample=None):
+    # Straight to a size x size RGBA silhouette, no SVG/PNG round trip. `supersample` renders
+    # at N x N samples per pixel and averages them down for anti-aliasing.
+    import numpy as np
+    from PIL import Image, ImageColor
+
+    size = size or SHAPE_SIZE
+    ss = supersample or SHAPE_SUPERSAMPLE
+    polygons, (xmin, xmax, ymin, ymax) = sample_path(path_data)
+    padding = 2
+    bounds = (xmin - padding, xmax + padding, ymin - padding, ymax + padding)
+    matrix = shape_matrix(bounds, rotation, size * ss)
+
+    def coverage(polys):
+        mask = fill_polygons(polys, matrix, size * ss, size * ss)
+        return mask.reshape(size, ss, size, ss).mean(axis=(1, 3))
+
+    rgba = np.zeros((size, size, 4), dtype=np.uint8)
+    rgba[:, :, :3] = ImageColor.getrgb(base_color)[:3]
+    rgba[:, :, 3] = np.round(coverage(polygons) * 255).astype(np.uint8)
+    img = Image.fromarray(rgba, mode="RGBA")
+
+    if accent_data:
+        accent_polygons, _ = sample_path(accent_data)
+        if accent_polygons:
+            accent = np.zeros((size, size, 4), dtype=np.uint8)
+            accent[:, :, 0] = 255
+            accent[:, :, 3] = np.round(coverage(accent_polygons) * 0.6 * 255).astype(np.uint8)
+            img = Image.alpha_composite(img, Image.fromarray(accent, mode="RGBA"))
+    return img
+
+def render_shape(designator, type, rotation=0, use_accent=False, base_color="black", df=None):
+    from rapidfuzz import process, fuzz
+
+    if df is None:
+        df = get_shape_df()
     row = df[df['designator'] == designator]
 
     if not row.empty:
         match_type = "exact"
-        print(f"✅ Exact designator match found: '{designator}'")
+        if VERBOSE:
+            print(f"✅ Exact designator match found: '{designator}'")
     else:
-        print(f"ℹ️ No exact match for designator '{designator}'. Trying fuzzy match using input type: '{type}'")
+        if VERBOSE:
+            print(f"ℹ️ No exact match for designator '{designator}'. Trying fuzzy match using input type: '{type}'")
         designator_list = df['description'].tolist()
         best_match, score, idx = process.extractOne(type, designator_list, scorer=fuzz.token_set_ratio)
 
         if score >= 65:
             row = df.iloc[[idx]]
             match_type = "fuzzy"
-            print(f"🔍 Fuzzy match result: input type '{type}' ≈ designator '{best_match}' (score: {score})")
+            if VERBOSE:
+                print(f"🔍 Fuzzy match result: input type '{type}' ≈ designator '{best_match}' (score: {score})")
         else:
-            print(f"No close match found for designator '{designator}' or type '{type}'")
+            if VERBOSE:
+                print(f"No close match found for designator '{designator}' or type '{type}'")
             return None, "no_match"
 
     # Proceed to extract and decode shape data
@@ -75,6 +266,18 @@ def render_shape(designator, type, rotation=0, use_accent=False, base_color="bla
         print(f"❌ No path data found in shape_data for '{row.iloc[0]['designator']}'")
         return
 
+    if SHAPE_RASTERIZER == "polygon":
+        try:
+            img = rasterize_shape(path_data, rotation=rotation, base_color=base_color,
+                                  accent_data=accent_data if use_accent else None)
+        except Exception as e:
+            print(f"❌ Error rasterizing shape for '{row.iloc[0]['designator']}': {e}")
+            return
+        return img, match_type
+
+    import cairosvg
+    from PIL import Image
+
     try:
         xmin, xmax, ymin, ymax = get_path_bounds(path_data)
  #       print(f"✅ Path bounds: xmin={xmin}, xmax={xmax}, ymin={ymin}, ymax={ymax}")
@@ -130,6 +333,296 @@ def nearest_palette_color(rgba):
             nearest = color
     return (*nearest, 255)
 
+def quantize_to_panel(img, dither=False):
+    # Whole-card nearest-colour match against PANEL_RGB, returns an HxW array of panel indices
+    import numpy as np
+
+    rgb = np.asarray(img.convert("RGB"), dtype=np.int32)
+    if dither:
+        h, w = rgb.shape[:2]
+        threshold = np.tile(np.array(BAYER_4X4, dtype=np.float32), (h // 4 + 1, w // 4 + 1))[:h, :w]
+        rgb = rgb + (threshold * DITHER_STRENGTH).astype(np.int32)[:, :, None]
+    panel_rgb = np.array(PANEL_RGB, dtype=np.int32)
+    dist = ((rgb[:, :, None, :] - panel_rgb[None, None, :, :]) ** 2).sum(axis=3)
+    return dist.argmin(axis=2).astype(np.uint8)
+
+def pack_2bit(indices):
+    # 4 pixels per byte, leftmost pixel in the high bits, rows padded to a whole byte
+    import numpy as np
+
+    h, w = indices.shape
+    padded_w = (w + 3) // 4 * 4
+    if padded_w != w:
+        indices = np.pad(indices, ((0, 0), (0, padded_w - w)))
+    quads = indices.reshape(h, padded_w // 4, 4)
+    packed = (quads[:, :, 0] << 6) | (quads[:, :, 1] << 4) | (quads[:, :, 2] << 2) | quads[:, :, 3]
+    return packed.astype(np.uint8).tobytes()
+
+def indices_to_image(indices):
+    from PIL import Image
+
+    preview = Image.fromarray(indices, mode="P")
+    preview.putpalette([c for name in PANEL_COLORS for c in PALETTE[name]])
+    return preview
+
+def write_atomic(path, data):
+    # Write to a temp file first so the display never fetches a half-written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def unpack_2bit(buf, width=WIDTH, height=HEIGHT):
+    # Inverse of pack_2bit, None if the buffer is not a full frame
+    import numpy as np
+
+    padded_w = (width + 3) // 4 * 4
+    if len(buf) != height * padded_w // 4:
+        return None
+    packed = np.frombuffer(buf, dtype=np.uint8).reshape(height, padded_w // 4)
+    quads = np.stack([(packed >> 6) & 3, (packed >> 4) & 3, (packed >> 2) & 3, packed & 3], axis=2)
+    return quads.reshape(height, padded_w)[:, :width]
+
+def load_framebuffer(path=FRAMEBUFFER_PATH, width=WIDTH, height=HEIGHT):
+    # Unpack the last buffer we wrote back into panel indices, None if missing or wrong size
+    try:
+        with open(path, "rb") as f:
+            buf = f.read()
+    except OSError:
+        return None
+    return unpack_2bit(buf, width, height)
+
+def dirty_rects(prev, curr, tile=DIRTY_TILE, gap=DIRTY_MERGE_GAP):
+    # Changed pixels reduced to a tile grid; dirty tiles within `gap` tiles of each other are
+    # grouped and each group becomes one [x, y, w, h] rect
+    import numpy as np
+
+    h, w = curr.shape
+    changed = prev != curr
+    th, tw = (h + tile - 1) // tile, (w + tile - 1) // tile
+    changed = np.pad(changed, ((0, th * tile - h), (0, tw * tile - w)))
+    tiles = changed.reshape(th, tile, tw, tile).any(axis=(1, 3))
+
+    boxes = []
+    seen = np.zeros_like(tiles)
+    for ty, tx in np.argwhere(tiles).tolist():
+        if seen[ty, tx]:
+            continue
+        seen[ty, tx] = True
+        stack = [(ty, tx)]
+        y0, y1, x0, x1 = ty, ty, tx, tx
+        while stack:
+            cy, cx = stack.pop()
+            y0, y1, x0, x1 = min(y0, cy), max(y1, cy), min(x0, cx), max(x1, cx)
+            ny0, ny1 = max(cy - gap, 0), min(cy + gap + 1, th)
+            nx0, nx1 = max(cx - gap, 0), min(cx + gap + 1, tw)
+            near = tiles[ny0:ny1, nx0:nx1] & ~seen[ny0:ny1, nx0:nx1]
+            for dy, dx in np.argwhere(near).tolist():
+                seen[ny0 + dy, nx0 + dx] = True
+                stack.append((ny0 + dy, nx0 + dx))
+        boxes.append([x0, y0, x1 + 1, y1 + 1])
+
+    # Group bounding boxes can still overlap each other, merge until they don't
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    if len(boxes) > MAX_DIRTY_RECTS:
+        boxes = [[min(b[0] for b in boxes), min(b[1] for b in boxes),
+                  max(b[2] for b in boxes), max(b[3] for b in boxes)]]
+
+    # Tile units to pixels, clipped to the screen
+    return [
+        [x0 * tile, y0 * tile, min(x1 * tile, w) - x0 * tile, min(y1 * tile, h) - y0 * tile]
+        for x0, y0, x1, y1 in sorted(boxes, key=lambda b: (b[1], b[0]))
+    ]
+
+def plan_refresh(prev, curr):
+    try:
+        with open(REFRESH_STATE_PATH, "r") as f:
+            state = json.load(f)
+    except Exception:
+        state = {}
+    partial_count = state.get("partial_count", 0)
+    partial_area = state.get("partial_area", 0.0)
+
+    h, w = curr.shape
+    if prev is None or prev.shape != curr.shape:
+        full, rects, reason = True, [], "no_previous_frame"
+    else:
+        rects = dirty_rects(prev, curr)
+        area = sum(rw * rh for _, _, rw, rh in rects) / float(w * h)
+        if not rects:
+            full, reason = False, "unchanged"
+        elif area > FULL_REFRESH_AREA:
+            full, reason = True, "changed_area"
+        elif partial_area + area > GHOSTING_BUDGET or partial_count + 1 > MAX_PARTIAL_REFRESHES:
+            full, reason = True, "ghosting_budget"
+        else:
+            full, reason = False, "partial"
+            partial_count += 1
+            partial_area += area
+
+    if full:
+        rects = [[0, 0, w, h]]
+        partial_count, partial_area = 0, 0.0
+
+    try:
+        with open(REFRESH_STATE_PATH, "w") as f:
+            json.dump({"partial_count": partial_count, "partial_area": partial_area}, f)
+    except Exception as e:
+        print(f"⚠️ Failed to save refresh state: {e}")
+
+    return {"full": full, "reason": reason, "width": w, "height": h, "rects": rects}
+
+def publish_refresh_plan(plan, path=REFRESH_JSON_PATH):
+    write_atomic(path, json.dumps(plan).encode("utf-8"))
+
+def card_heading(latest_alert):
+    # The silhouette is rotated in whole degrees so the cache key and the pixels agree
+    heading = latest_alert.get("heading", 0)
+    try:
+        return int(round(float(heading)))
+    except (TypeError, ValueError):
+        return heading
+
+def card_cache_key(latest_alert, now, output, dither):
+    # Hash only what ends up on the card, time-varying parts at the resolution they are drawn at
+    flight_info = latest_alert.get("flight_info", {}) or {}
+    aircraft_info = latest_alert.get("aircraft_info", {}) or {}
+    red_width, remaining_text, temp_str = bottom_bar_state(latest_alert, WIDTH, now)
+    fields = {
+        "version": CARD_CACHE_VERSION,
+        "output": output,
+        "dither": bool(dither) if output == "eink" else False,
+        "flight": latest_alert.get("flight", "N/A"),
+        "manufacturer": aircraft_info.get("manufacturer", ""),
+        "type": aircraft_info.get("type", ""),
+        "icao_type": aircraft_info.get("icao_type"),
+        "speed": str(latest_alert.get("speed", "N/A")),
+        "altitude": str(latest_alert.get("altitude", "N/A")),
+        "origin_iata": flight_info.get("origin_iata", "N/A") or "N/A",
+        "destination_iata": flight_info.get("destination_iata", "N/A") or "N/A",
+        "origin": (flight_info.get("origin", "Unknown") or "Unknown").split(",")[0],
+        "destination": (flight_info.get("destination", "Unknown") or "Unknown").split(",")[0],
+        "heading": card_heading(latest_alert),
+        "bottom_bar": [red_width, remaining_text, temp_str],
+    }
+    blob = json.dumps(fields, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(blob).hexdigest()
+
+def card_cache_get(key, ext):
+    path = os.path.join(CARD_CACHE_DIR, f"{key}.{ext}")
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    # Bump mtime so eviction treats it as most recently used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return data
+
+def card_cache_put(key, ext, data):
+    try:
+        os.makedirs(CARD_CACHE_DIR, exist_ok=True)
+        write_atomic(os.path.join(CARD_CACHE_DIR, f"{key}.{ext}"), data)
+
+        entries = []
+        for entry in os.scandir(CARD_CACHE_DIR):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > CARD_CACHE_MAX_ENTRIES or total_bytes > CARD_CACHE_MAX_BYTES):
+            _, size, path = entries.pop(0)
+            os.remove(path)
+            total_bytes -= size
+    except Exception as e:
+        print(f"⚠️ Card cache write failed: {e}")
+
+def record_card_cache_stats(hit, elapsed):
+    try:
+        with open(CARD_CACHE_STATS_PATH, "r") as f:
+            stats = json.load(f)
+    except Exception:
+        stats = {"hits": 0, "misses": 0, "render_seconds": 0.0, "hit_seconds": 0.0}
+
+    if hit:
+        stats["hits"] += 1
+        stats["hit_seconds"] += elapsed
+    else:
+        stats["misses"] += 1
+        stats["render_seconds"] += elapsed
+
+    lookups = stats["hits"] + stats["misses"]
+    avg_render = stats["render_seconds"] / stats["misses"] if stats["misses"] else 0.0
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["avg_render_ms"] = round(avg_render * 1000, 2)
+    stats["saved_seconds"] = round(max(0.0, stats["hits"] * avg_render - stats["hit_seconds"]), 3)
+
+    try:
+        with open(CARD_CACHE_STATS_PATH, "w") as f:
+            json.dump(stats, f, indent=2)
+    except Exception as e:
+        print(f"⚠️ Failed to save card cache stats: {e}")
+    return stats
+
+@lru_cache(maxsize=None)
+def get_font(path=None, size=None):
+    from PIL import ImageFont
+
+    if path is None:
+        return ImageFont.load_default()
+    try:
+        return ImageFont.truetype(path, size)
+    except Exception:
+        return ImageFont.load_default()
+
+@lru_cache(maxsize=256)
+def load_logo(operator_code, logo_size=52):
+    # Operator logo reduced to the card palette and thumbnailed, None if there is no logo
+    from PIL import Image
+
+    logo_path = os.path.join(LOGO_DIR, f"{operator_code}.png")
+    try:
+        logo_img = Image.open(logo_path).convert("RGBA")
+    except Exception:
+        return None
+    pixels = logo_img.load()
+    for y in range(logo_img.height):
+        for x in range(logo_img.width):
+            pixels[x,y] = nearest_palette_color(pixels[x,y])
+    logo_img.thumbnail((logo_size,logo_size), Image.Resampling.LANCZOS)
+    return logo_img
+
+def preload(operator_codes=()):
+    # Load the shape store and render modules and warm the font/logo caches, so long-lived
+    # renderers such as card_batch workers don't pay for them on their first card
+    import numpy
+    import svgpathtools
+    import rapidfuzz
+    from PIL import Image, ImageDraw
+
+    get_shape_df()
+    for path, size in CARD_FONTS:
+        get_font(path, size)
+    for code in operator_codes:
+        load_logo(code)
+
 def draw_header(draw, img, width, flight_number, flight_info, aircraft_info, latest_alert):
     header_height = 52
     bg_color = (0,0,0)
@@ -139,12 +632,8 @@ def draw_header(draw, img, width, flight_number, flight_info, aircraft_info, lat
     info_start_x = logo_size + 5
 
     draw.rectangle([0,0,width,header_height], fill=bg_color)
-    try:
-        font_large = ImageFont.truetype("./Anton-Regular.ttf", 50)
-        font_small = ImageFont.truetype("./Roboto-Medium.ttf", 12)
-    except:
-        font_large = ImageFont.load_default()
-        font_small = ImageFont.load_default()
+    font_large = get_font("./Anton-Regular.ttf", 50)
+    font_small = get_font("./Roboto-Medium.ttf", 12)
 
     manufacturer = aircraft_info.get("manufacturer", "")
     aircraft_type = aircraft_info.get("type", "")  # Note: use aircraft_info here, not flight_info
@@ -167,19 +656,12 @@ def draw_header(draw, img, width, flight_number, flight_info, aircraft_info, lat
     altitude_ft = latest_alert.get("altitude", "N/A")
 
     operator_code = flight_number[:3].upper()
-    logo_filename = f"{operator_code}.png"
-    logo_path = f"./operator_logos/airline-logos/radarbox_logos/{logo_filename}"
+    logo_img = load_logo(operator_code, logo_size)
 
-    try:
-        logo_img = Image.open(logo_path).convert("RGBA")
-        pixels = logo_img.load()
-        for y in range(logo_img.height):
-            for x in range(logo_img.width):
-                pixels[x,y] = nearest_palette_color(pixels[x,y])
-        logo_img.thumbnail((logo_size,logo_size), Image.Resampling.LANCZOS)
+    if logo_img is not None:
         logo_y = (header_height - logo_img.height)//2
         img.paste(logo_img, (0, logo_y), logo_img)
-    except Exception:
+    else:
         logo_y = (header_height - logo_size)//2
         draw.rectangle([0, logo_y, logo_size, logo_y + logo_size], fill=(255,255,255))
 
@@ -211,15 +693,8 @@ def draw_middle_section(draw, width, height, flight_info):
 
     draw.rectangle([0, section_top, width, section_top + section_height], fill=bg_color)
 
-    try:
-        font_iata = ImageFont.truetype("./Anton-Regular.ttf", 85)
-    except:
-        font_iata = ImageFont.load_default()
-
-    try:
-        font_full = ImageFont.truetype("./Roboto_Condensed-SemiBold.ttf", 18)
-    except:
-        font_full = ImageFont.load_default()
+    font_iata = get_font("./Anton-Regular.ttf", 85)
+    font_full = get_font("./Roboto_Condensed-SemiBold.ttf", 18)
 
     origin_iata = flight_info.get("origin_iata", "N/A") or "N/A"
     destination_iata = flight_info.get("destination_iata", "N/A") or "N/A"
@@ -265,7 +740,7 @@ def draw_middle_section(draw, width, height, flight_info):
         width=2,
     )
 
-    font = ImageFont.load_default()
+    font = get_font()
     for i in range(60):
         angle = math.radians(i * 6)
         tick_len = radius * 0.15 if i % 15 == 0 else radius * 0.07
@@ -283,24 +758,19 @@ def draw_middle_section(draw, width, height, flight_info):
             text_h = text_bbox[3] - text_bbox[1]
             draw.text((label_x - text_w / 2, label_y - text_h / 2), label, fill="black", font=font)
 
-def draw_bottom_bar(draw, img, latest_alert):
-    bar_height = 20
-    width, height = img.size
-    bar_y = height - bar_height
-
+def bottom_bar_state(latest_alert, width, now=None):
+    # Everything the bottom bar shows, at pixel / minute resolution: (red bar width, remaining text, temperature text)
+    now = now or datetime.now(timezone.utc)
     departure_str = latest_alert.get("departure_time_actual")
     arrival_str = latest_alert.get("arrival_time_estimated")
     progress_percent = latest_alert.get("percent_complete", 0) or 0
     temperature_c = latest_alert.get("temperature_c")
 
-    draw.rectangle([(0, bar_y), (width, height)], fill="black")
-
     if departure_str and arrival_str and departure_str.lower() != "n/a" and arrival_str.lower() != "n/a":
         fmt = "%Y-%m-%d %H:%M:%S %Z"
         try:
             departure_time = datetime.strptime(departure_str, fmt).replace(tzinfo=timezone.utc)
             arrival_time = datetime.strptime(arrival_str, fmt).replace(tzinfo=timezone.utc)
-            now = datetime.now(timezone.utc)
 
             total_secs = (arrival_time - departure_time).total_seconds()
             elapsed_secs = (now - departure_time).total_seconds()
@@ -311,12 +781,10 @@ def draw_bottom_bar(draw, img, latest_alert):
         progress = progress_percent / 100
 
     red_width = int(width * progress)
-    draw.rectangle([(0, bar_y), (red_width, height)], fill="red")
 
-    # Draw remaining time text
+    # Remaining time text
     if departure_str and arrival_str:
         try:
-            now = datetime.now(timezone.utc)
             arrival_time = datetime.strptime(arrival_str, "%Y-%m-%d %H:%M:%S %Z").replace(tzinfo=timezone.utc)
             remaining = arrival_time - now
             if remaining.total_seconds() < 0:
@@ -330,11 +798,22 @@ def draw_bottom_bar(draw, img, latest_alert):
     else:
         text = ""
 
-    try:
-        font = ImageFont.truetype("./Anton-Regular.ttf", 16)
-    except:
-        font = ImageFont.load_default()
+    temp_str = f"{int(temperature_c)}°C" if temperature_c is not None else None
+    return red_width, text, temp_str
 
+def draw_bottom_bar(draw, img, latest_alert, now=None):
+    bar_height = 20
+    width, height = img.size
+    bar_y = height - bar_height
+
+    red_width, text, temp_str = bottom_bar_state(latest_alert, width, now)
+
+    draw.rectangle([(0, bar_y), (width, height)], fill="black")
+    draw.rectangle([(0, bar_y), (red_width, height)], fill="red")
+
+    font = get_font("./Anton-Regular.ttf", 16)
+
+    # Draw remaining time text
     bbox = font.getbbox(text)
     text_width = bbox[2] - bbox[0]
     text_height = bbox[3] - bbox[1]
@@ -343,8 +822,7 @@ def draw_bottom_bar(draw, img, latest_alert):
     draw.text((text_x, text_y - 4), text, font=font, fill="white")
 
     # Draw temperature
-    if temperature_c is not None:
-        temp_str = f"{int(temperature_c)}°C"
+    if temp_str is not None:
         temp_bbox = font.getbbox(temp_str)
         temp_width = temp_bbox[2] - temp_bbox[0]
         temp_height = temp_bbox[3] - temp_bbox[1]
@@ -362,6 +840,8 @@ def draw_bottom_bar(draw, img, latest_alert):
         draw.text((temp_x, temp_y), temp_str, font=font, fill="yellow")
 
 def draw_aircraft_background(img, icao_type, type, heading):
+    from PIL import Image
+
     if not icao_type or icao_type == "N/A":
         return "no_match"
     try:
@@ -381,9 +861,8 @@ def draw_aircraft_background(img, icao_type, type, heading):
 
 
 
-def process_flight_data(latest_alert):
-
-
+def render_card(latest_alert, now=None):
+    from PIL import Image, ImageDraw
 
     img = Image.new("RGBA", (WIDTH, HEIGHT), "white")
     draw = ImageDraw.Draw(img)
@@ -401,26 +880,141 @@ def process_flight_data(latest_alert):
     # Aircraft background
     icao_type = aircraft_info.get("icao_type")
     ac_type = aircraft_info.get("type")
-    heading = latest_alert.get("heading", 0)
+    heading = card_heading(latest_alert)
     draw_aircraft_background(img, icao_type, ac_type, heading)
 
     # Bottom progress and temperature bar
-    draw_bottom_bar(draw, img, latest_alert)
+    draw_bottom_bar(draw, img, latest_alert, now)
+    return img
 
-    img = img.convert("RGB")
-    img.save(PNG_PATH,format="PNG",
+def encode_png(img):
+    buf = io.BytesIO()
+    img.convert("RGB").save(buf, format="PNG",
         optimize=True,
         compress_level=6,  # Reasonable compression without risk of artifacts
         interlace=False)
+    return buf.getvalue()
+
+def process_flight_data(latest_alert, output="png", dither=False, preview=False, use_cache=True):
+    # output="png" keeps the RGB PNG; output="eink" writes the packed 2-bit panel buffer instead
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    ext = "bin" if output == "eink" else "png"
+
+    key = card_cache_key(latest_alert, now, output, dither) if use_cache else None
+    data = card_cache_get(key, ext) if key else None
+    hit = data is not None
+
+    if not hit:
+        img = render_card(latest_alert, now)
+        if output == "eink":
+            data = pack_2bit(quantize_to_panel(img, dither=dither))
+        else:
+            data = encode_png(img)
+        if key:
+            card_cache_put(key, ext, data)
+
+    if output == "eink":
+        prev = load_framebuffer(FRAMEBUFFER_PATH)
+        write_atomic(FRAMEBUFFER_PATH, data)
+        indices = unpack_2bit(data)
+        if preview:
+            indices_to_image(indices).save(PREVIEW_PATH, format="PNG")
+        plan = plan_refresh(prev, indices)
+        publish_refresh_plan(plan, REFRESH_JSON_PATH)
+        refresh_desc = "full refresh" if plan["full"] else f"{len(plan['rects'])} dirty rects"
+        print(f"Flight card framebuffer saved to: {FRAMEBUFFER_PATH} ({refresh_desc}, {plan['reason']})")
+    else:
+        write_atomic(PNG_PATH, data)
+        print(f"Flight card PNG saved to: {PNG_PATH}")
 
-  
-
-
+    if key:
+        stats = record_card_cache_stats(hit, time.perf_counter() - started)
+        print(f"Card cache {'hit' if hit else 'miss'} (hit ratio {stats['hit_ratio']:.0%}, "
+              f"saved {stats['saved_seconds']:.1f}s so far)")
 
+# Heavy modules the full (cache miss) render path pulls in
+RENDER_MODULES = ["PIL.Image", "PIL.ImageDraw", "PIL.ImageFont", "numpy", "pandas",
+                  "svgpathtools", "rapidfuzz"]
 
-    print(f"Flight card PNG saved to: {PNG_PATH}")
+def import_render_modules():
+    # __import__ rather than importlib so the imports show up in -X importtime output
+    for name in RENDER_MODULES:
+        try:
+            __import__(name)
+        except Exception as e:
+            print(f"⚠️ Could not import {name}: {e}")
+
+def parse_importtime(stderr):
+    # `python -X importtime` lines -> [(module, depth, self_us, cumulative_us)]
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+def run_python(code, extra_args=()):
+    import subprocess
+
+    return subprocess.run([sys.executable, *extra_args, "-c", code],
+                          cwd=os.path.dirname(os.path.abspath(__file__)),
+                          capture_output=True, text=True)
+
+def report_import_times(top=15):
+    scenarios = [
+        ("startup (import card5)", "import card5"),
+        ("full render path", "import card5; card5.import_render_modules()"),
+    ]
+    for title, code in scenarios:
+        result = run_python(code, ["-X", "importtime"])
+        rows = parse_importtime(result.stderr)
+        top_level = sorted((r for r in rows if r[1] == 0), key=lambda r: r[3], reverse=True)
+        total_us = sum(r[3] for r in top_level)
+        print(f"\n=== {title}: {total_us / 1000:.1f} ms in imports ===")
+        print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for name, _, self_us, cumulative_us in top_level[:top]:
+            print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+def startup_bench(runs=STARTUP_BENCH_RUNS, budget_ms=STARTUP_BUDGET_MS):
+    # Median wall time of `import card5` in a fresh interpreter, minus bare interpreter startup
+    def median_ms(code):
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            run_python(code)
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        return samples[len(samples) // 2]
+
+    baseline_ms = median_ms("pass")
+    card5_ms = median_ms("import card5")
+    overhead_ms = card5_ms - baseline_ms
+    ok = overhead_ms <= budget_ms
+    print(f"Interpreter startup: {baseline_ms:.1f} ms")
+    print(f"import card5:        {card5_ms:.1f} ms (+{overhead_ms:.1f} ms, budget {budget_ms} ms)")
+    print("✅ Within startup budget" if ok else "❌ Startup budget exceeded")
+    return ok
 
 if __name__ == "__main__":
+    # --importtime: per-module import breakdown, --startup-bench: check STARTUP_BUDGET_MS
+    if "--importtime" in sys.argv:
+        report_import_times()
+        sys.exit(0)
+    if "--startup-bench" in sys.argv:
+        sys.exit(0 if startup_bench() else 1)
+
+    # --json PATH / --png PATH: another site's alert JSON and card (alert18 --sites)
+    if "--json" in sys.argv[:-1]:
+        CARD_JSON_FILE = sys.argv[sys.argv.index("--json") + 1]
+    if "--png" in sys.argv[:-1]:
+        PNG_PATH = sys.argv[sys.argv.index("--png") + 1]
+
     try:
         with open(CARD_JSON_FILE, "r") as f:
             latest_alert = json.load(f)
@@ -428,5 +1022,11 @@ if __name__ == "__main__":
         print(f"Failed to read alert JSON: {e}")
         latest_alert = None
 
-    process_flight_data(latest_alert)
+    # --eink: panel framebuffer instead of PNG, --dither: ordered dithering, --preview: also save a preview PNG
+    # --no-cache: always render from scratch
+    output = "eink" if "--eink" in sys.argv else "png"
+    process_flight_data(latest_alert, output=output,
+                        dither="--dither" in sys.argv,
+                        preview="--preview" in sys.argv,
+                        use_cache="--no-cache" not in sys.argv)
 
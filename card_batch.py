@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+# Batch renderer for flight cards.
+#
+#   python card_batch.py alerts.ndjson -o cards/          # one alert dict per line ("-" reads stdin)
+#   python card_batch.py --from-db flights_stats.db -o cards/ --limit 500
+#   python card_batch.py alerts.ndjson -o cards/ --eink --now "2025-08-12 18:00:00"
+#
+# Cards are rendered across all cores. Every worker imports card5 (shape store) and warms its
+# font/logo caches once, then renders many cards. Per-card timings go to <out>/timings.ndjson
+# and a summary to <out>/summary.json so render performance can be compared between runs.
+
+DB_FILE = "flights_stats.db"
+
+# per-worker render settings, filled in by init_worker
+worker_settings = {}
+
+
+def read_ndjson(path):
+    f = sys.stdin if path == "-" else open(path, "r")
+    try:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"⚠️ Skipping line {line_no}: {e}", file=sys.stderr)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def alerts_from_db(db_path, limit=None):
+    # Rebuild alert dicts from logged flight_events (no times or heading are stored there)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    query = "SELECT * FROM flight_events ORDER BY id"
+    params = ()
+    if limit:
+        query += " LIMIT ?"
+        params = (limit,)
+    try:
+        for row in conn.execute(query, params):
+            yield {
+                "flight": row["flight_number"] or "N/A",
+                "aircraft_info": {
+                    "manufacturer": row["manufacturer"],
+                    "type": row["model"],
+                    "registration": row["registration"],
+                    "operator": row["operator"],
+                },
+                "flight_info": {
+                    "origin_iata": row["origin_iata"],
+                    "origin": row["origin_name"],
+                    "destination_iata": row["destination_iata"],
+                    "destination": row["destination_name"],
+                },
+                "speed": row["speed"],
+                "altitude": row["altitude"],
+            }
+    finally:
+        conn.close()
+
+
+def init_worker(operator_codes, output, dither, out_dir, now, verbose):
+    import card5
+
+    card5.VERBOSE = verbose
+    card5.preload(operator_codes)  # shape store, render modules, fonts and logos, once per worker
+    worker_settings.update(output=output, dither=dither, out_dir=out_dir, now=now)
+
+
+def render_one(job):
+    import card5
+
+    index, alert = job
+    output = worker_settings["output"]
+    flight = str(alert.get("flight") or "N/A")
+    safe_flight = re.sub(r"[^A-Za-z0-9_-]", "_", flight) or "N_A"
+    ext = "bin" if output == "eink" else "png"
+    path = os.path.join(worker_settings["out_dir"], f"card_{index:05d}_{safe_flight}.{ext}")
+
+    started = time.perf_counter()
+    try:
+        img = card5.render_card(alert, worker_settings["now"])
+        render_ms = (time.perf_counter() - started) * 1000
+
+        if output == "eink":
+            data = card5.pack_2bit(card5.quantize_to_panel(img, dither=worker_settings["dither"]))
+        else:
+            data = card5.encode_png(img)
+        with open(path, "wb") as f:
+            f.write(data)
+        error = None
+    except Exception as e:
+        render_ms = (time.perf_counter() - started) * 1000
+        data = b""
+        error = str(e)
+
+    return {
+        "index": index,
+        "flight": flight,
+        "path": path if error is None else None,
+        "render_ms": round(render_ms, 2),
+        "total_ms": round((time.perf_counter() - started) * 1000, 2),
+        "bytes": len(data),
+        "pid": os.getpid(),
+        "error": error,
+    }
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render many flight cards in parallel")
+    parser.add_argument("input", nargs="?", default="-", help="NDJSON file of alert dicts, '-' for stdin")
+    parser.add_argument("-o", "--out-dir", required=True, help="directory for rendered cards")
+    parser.add_argument("--from-db", metavar="DB", nargs="?", const=DB_FILE,
+                        help=f"regenerate cards from flight_events (default {DB_FILE})")
+    parser.add_argument("--limit", type=int, help="max cards to render")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--eink", action="store_true", help="write packed 2-bit framebuffers instead of PNG")
+    parser.add_argument("--dither", action="store_true", help="ordered dithering for --eink")
+    parser.add_argument("--now", help="render as if the time were this UTC 'YYYY-MM-DD HH:MM:SS' (reproducible progress bars)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args()
+
+    now = None
+    if args.now:
+        now = datetime.strptime(args.now, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+
+    if args.from_db:
+        alerts = list(alerts_from_db(args.from_db, args.limit))
+    else:
+        alerts = list(read_ndjson(args.input))
+        if args.limit:
+            alerts = alerts[:args.limit]
+
+    if not alerts:
+        print("No alerts to render.")
+        return 1
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    output = "eink" if args.eink else "png"
+    operator_codes = sorted({str(a.get("flight") or "N/A")[:3].upper() for a in alerts})
+
+    print(f"Rendering {len(alerts)} cards with {args.jobs} workers → {args.out_dir}")
+    results = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker,
+                             initargs=(operator_codes, output, args.dither, args.out_dir, now, not args.quiet)) as pool:
+        chunksize = max(1, len(alerts) // (args.jobs * 8))
+        with open(os.path.join(args.out_dir, "timings.ndjson"), "w") as timings:
+            for result in pool.map(render_one, enumerate(alerts), chunksize=chunksize):
+                results.append(result)
+                timings.write(json.dumps(result) + "\n")
+                if args.quiet:
+                    continue
+                if result["error"]:
+                    print(f"❌ #{result['index']} {result['flight']}: {result['error']}")
+                else:
+                    print(f"✅ #{result['index']} {result['flight']}: {result['render_ms']:.1f} ms render, "
+                          f"{result['total_ms']:.1f} ms total")
+    wall = time.perf_counter() - started
+
+    ok = [r for r in results if not r["error"]]
+    render_ms = [r["render_ms"] for r in ok]
+    total_ms = [r["total_ms"] for r in ok]
+    summary = {
+        "cards": len(results),
+        "failed": len(results) - len(ok),
+        "workers": args.jobs,
+        "output": output,
+        "wall_seconds": round(wall, 3),
+        "cards_per_second": round(len(results) / wall, 2) if wall > 0 else None,
+        "render_ms_mean": round(sum(render_ms) / len(render_ms), 2) if render_ms else None,
+        "render_ms_p50": percentile(render_ms, 50),
+        "render_ms_p95": percentile(render_ms, 95),
+        "render_ms_max": max(render_ms) if render_ms else None,
+        "total_ms_mean": round(sum(total_ms) / len(total_ms), 2) if total_ms else None,
+    }
+    with open(os.path.join(args.out_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"Rendered {len(ok)}/{len(results)} cards in {wall:.2f}s "
+          f"({summary['cards_per_second']} cards/s, p50 {summary['render_ms_p50']} ms, "
+          f"p95 {summary['render_ms_p95']} ms)")
+    return 0 if len(ok) == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,6 +14,10 @@ from rapidfuzz import process, fuzz
 from PIL import Image, ImageDraw, ImageFont, ImageColor
 from tabulate import tabulate
 import hashlib
+import threading
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+import card5  # panel framebuffer and partial-refresh plan (its heavy imports are lazy)
 
 WIDTH = 384
 HEIGHT = 184
@@ -45,9 +49,29 @@ PUBLISH_SCHEDULE = {
 DISABLED_MONTHS = ['jan', 'feb']
 DISPLAY_CONFIG_PATH = "display_config.json"
 PNG_URL = "flight_card.png"  # Adjust if hosted remotely (e.g., a URL)
+FRAMEBUFFER_URL = "http://192.168.0.105:8080/flight_card.bin"
+REFRESH_URL = "http://192.168.0.105:8080/flight_card_refresh.json"
 last_flight = None
 last_data_hash = None
 
+DISPLAY_JSON_PATH = "/usr/share/skyaware/html/flight_card.html"
+HOUSEKEEPING_SECONDS = 15     # max sleep between wakeups when no file event arrives (schedule/stale checks)
+STATS_INTERVAL_SECONDS = 600  # how often the watcher prints its CPU / wakeup rates
+DETAIL_REDRAW_SECONDS = 20    # same flight, header/route/silhouette changed: batch updates this long
+PROGRESS_REDRAW_SECONDS = 60  # same flight, only the progress bar / time left changed
+last_display_json = None
+
+# Watcher counters, reported per hour by report_watch_stats()
+watch_stats = {
+    "wakeups": 0,
+    "file_events": 0,
+    "reads": 0,
+    "draws": 0,
+    "redraws_avoided": 0,
+    "display_writes": 0,
+    "display_writes_skipped": 0,
+}
+
 
 def get_path_bounds(path_str):
     path = parse_path(path_str)
@@ -336,11 +360,9 @@ def draw_middle_section(draw, width, height, flight_info):
 
 
 
-def draw_bottom_bar(draw, img, flight_info, timestamp_str, temperature_str):
-    bar_height = 20
-    width, height = img.size
-    bar_y = height - bar_height
-
+def bottom_bar_state(flight_info, timestamp_str, temperature_str, width=WIDTH):
+    # What draw_bottom_bar puts on screen, at pixel/minute resolution:
+    # None when the bar is not drawn, else (red bar px, remaining text, temperature box text, temperature text)
     fmt = "%Y-%m-%d %H:%M:%S %Z"
     now = datetime.strptime(timestamp_str, fmt).replace(tzinfo=timezone.utc)
 
@@ -348,19 +370,15 @@ def draw_bottom_bar(draw, img, flight_info, timestamp_str, temperature_str):
     arrival_str = flight_info.get("arrival_time_estimated")
 
     if not takeoff_str or not arrival_str or takeoff_str.lower() == "n/a" or arrival_str.lower() == "n/a":
-        return
+        return None
 
     takeoff_time = datetime.strptime(takeoff_str, fmt).replace(tzinfo=timezone.utc)
     arrival_time = datetime.strptime(arrival_str, fmt).replace(tzinfo=timezone.utc)
 
-    draw.rectangle([(0, bar_y), (width, height)], fill="black")
-
     total = (arrival_time - takeoff_time).total_seconds()
     elapsed = (now - takeoff_time).total_seconds()
     progress = max(0.0, min(1.0, elapsed / total)) if total > 0 else 0
-
     red_width = int(width * progress)
-    draw.rectangle([(0, bar_y), (red_width, height)], fill="red")
 
     remaining = arrival_time - now
     if remaining.total_seconds() < 0:
@@ -370,6 +388,24 @@ def draw_bottom_bar(draw, img, flight_info, timestamp_str, temperature_str):
         mins = rem // 60
         text = f"{hrs}h {mins:02}m"
 
+    if temperature_str:
+        return red_width, text, str(temperature_str), f"{int(temperature_str)}°C"
+    return red_width, text, None, None
+
+
+def draw_bottom_bar(draw, img, flight_info, timestamp_str, temperature_str):
+    bar_height = 20
+    width, height = img.size
+    bar_y = height - bar_height
+
+    state = bottom_bar_state(flight_info, timestamp_str, temperature_str, width)
+    if state is None:
+        return
+    red_width, text, temp_str, temp_text = state
+
+    draw.rectangle([(0, bar_y), (width, height)], fill="black")
+    draw.rectangle([(0, bar_y), (red_width, height)], fill="red")
+
     font_path = "./Anton-Regular.ttf"
     font_size = 16
     font = ImageFont.truetype(font_path, font_size)
@@ -383,8 +419,7 @@ def draw_bottom_bar(draw, img, flight_info, timestamp_str, temperature_str):
     draw.text((text_x, text_y - 4), text, font=font, fill="white")
 
     # 🔲 Draw temperature block on bottom-right
-    if temperature_str:
-        temp_str = str(temperature_str)
+    if temp_str:
         temp_bbox = font.getbbox(temp_str)
         temp_width = temp_bbox[2] - temp_bbox[0]
         temp_height = temp_bbox[3] - temp_bbox[1]
@@ -399,7 +434,6 @@ def draw_bottom_bar(draw, img, flight_info, timestamp_str, temperature_str):
         draw.rectangle([(square_x0, square_y0), (square_x1, square_y1)], fill="black")
         temp_x = square_x0 + padding
         temp_y = bar_y + (bar_height - temp_height) // 2 - 5
-        temp_text = f"{int(temperature_str)}°C"
         draw.text((temp_x, text_y-4), temp_text, font=font, fill="yellow")
 
 
@@ -453,6 +487,7 @@ def should_publish():
     return False
 
 def write_display_json(display: bool, refresh: bool, png_url: str = None):
+    global last_display_json
     data = {
         "display": display,
         "refresh": refresh,
@@ -460,16 +495,65 @@ def write_display_json(display: bool, refresh: bool, png_url: str = None):
     }
     if display:
         data["png_url"] = "http://192.168.0.105:8080/flight_card.png"
+        # Same card as the panel's packed 2-bit buffer, plus the dirty rects against the previous one
+        data["fb_url"] = FRAMEBUFFER_URL
+        data["refresh_url"] = REFRESH_URL
+
+    # Only touch the file when the content actually changes
+    text = json.dumps(data)
+    if text == last_display_json:
+        watch_stats["display_writes_skipped"] += 1
+        return False
 
-    with open("/usr/share/skyaware/html/flight_card.html", "w") as f:
-        json.dump(data ,f)
+    with open(DISPLAY_JSON_PATH, "w") as f:
+        f.write(text)
+    last_display_json = text
+    watch_stats["display_writes"] += 1
+    return True
+
+
+def card_heading(data):
+    # The silhouette is drawn in whole degrees so sub-degree track jitter never changes pixels
+    heading = data.get("heading")
+    try:
+        return int(round(float(heading)))
+    except (TypeError, ValueError):
+        return heading
+
+
+def render_hashes(data):
+    # Hashes over exactly what draw_card renders: (card body, bottom bar). The bottom bar is
+    # kept separate so progress-only changes can be told apart from everything else.
+    flight_info = data.get("flight_info", {})
+    card = {
+        "flight": data.get("flight"),
+        "type": flight_info.get("type", "Unknown"),
+        "speed": str(flight_info.get("speed", "N/A")),
+        "altitude_ft": str(flight_info.get("altitude_ft", "N/A")),
+        "origin_iata": flight_info.get("origin_iata", "N/A"),
+        "destination_iata": flight_info.get("destination_iata", "N/A"),
+        "origin": (flight_info.get("origin") or "Unknown").split(",")[0],
+        "destination": (flight_info.get("destination") or "Unknown").split(",")[0],
+        "icao_type": data.get("icao_type"),
+        "ac_type": data.get("type"),
+        "heading": card_heading(data),
+    }
+    try:
+        bar = bottom_bar_state(flight_info, data.get("timestamp"), data.get("temperature_c"))
+    except Exception:
+        bar = "unparseable"
+
+    def digest(value):
+        return hashlib.md5(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+    return digest(card), digest(bar)
 
 
 def draw_card(data):
     output_path = "/usr/share/skyaware/html/flight_card.png"
     WIDTH, HEIGHT = 384, 184
 
-    heading = data.get("heading")
+    heading = card_heading(data)
     img = Image.new("RGB", (WIDTH, HEIGHT), (255, 255, 255))
     draw = ImageDraw.Draw(img)
 
@@ -479,10 +563,22 @@ def draw_card(data):
     draw_bottom_bar(draw, img, data["flight_info"], data["timestamp"], data["temperature_c"])
 
     img.save(output_path)
+    write_framebuffer(img)
 
     return output_path, match_type  # return info needed for display json & print table
 
 
+def write_framebuffer(img):
+    # The card in the panel's native layout (see card5.FRAMEBUFFER_PATH), and the partial-refresh
+    # plan against the buffer drawn before it
+    data = card5.pack_2bit(card5.quantize_to_panel(img))
+    prev = card5.load_framebuffer(card5.FRAMEBUFFER_PATH)
+    card5.write_atomic(card5.FRAMEBUFFER_PATH, data)
+    plan = card5.plan_refresh(prev, card5.unpack_2bit(data))
+    card5.publish_refresh_plan(plan)
+    return plan
+
+
 def load_flight_data(json_path):
     try:
         with open(json_path, "r") as f:
@@ -490,7 +586,10 @@ def load_flight_data(json_path):
     except Exception as e:
         print(f"Error loading JSON '{json_path}': {e}")
         return {}
-        
+    return parse_flight_data(data)
+
+
+def parse_flight_data(data):
     flight = data.get("flight") or data.get("flight_info", {}).get("flight") or "N/A"
     icao_type = data.get("aircraft_info", {}).get("icao_type") or "N/A"
     operator = data.get("aircraft_info", {}).get("operator") or "N/A"
@@ -587,78 +686,164 @@ def print_match_table(matches, call_count=0):
     print(tabulate(rows, headers=headers, tablefmt="pretty"))
 
 
+class FlightJsonHandler(FileSystemEventHandler):
+    # watchdog uses inotify on Linux: we sleep until the kernel reports a change to json_path
+    def __init__(self, json_path, changed):
+        self.json_path = os.path.abspath(json_path)
+        self.changed = changed
+
+    def on_any_event(self, event):
+        # Our own reads show up as opened/closed_no_write events, only react to real writes
+        if event.event_type not in ("created", "modified", "moved", "deleted", "closed"):
+            return
+        paths = [getattr(event, "src_path", None), getattr(event, "dest_path", None)]
+        if any(p and os.path.abspath(p) == self.json_path for p in paths):
+            watch_stats["file_events"] += 1
+            self.changed.set()
+
+
+def report_watch_stats(started_wall, started_cpu):
+    hours = max((time.monotonic() - started_wall) / 3600, 1e-9)
+    cpu_seconds = time.process_time() - started_cpu
+    print(f"[📊] {watch_stats['wakeups'] / hours:.0f} wakeups/h, "
+          f"{watch_stats['file_events'] / hours:.0f} file events/h, "
+          f"{cpu_seconds / hours:.2f} CPU s/h, "
+          f"{watch_stats['draws']} draws ({watch_stats['redraws_avoided']} unchanged skipped), "
+          f"{watch_stats['display_writes']} display writes "
+          f"({watch_stats['display_writes_skipped']} unchanged skipped)")
+
+
 def watch_and_run(json_path):
-    last_hash = None
+    last_raw = None
     last_flight = None
-    last_draw_time = 0
-
-    while True:
-        # ✅ 1. Missing JSON
-        if not os.path.exists(json_path):
-            print("[🟡] JSON file missing")
-            write_display_json(display=False, refresh=False)
-            time.sleep(2)
-            continue
+    drawn = (None, None)  # render_hashes() of the card currently on screen
+    redraw_due = None     # monotonic deadline of a batched same-flight redraw
+    data = None
+    status = None  # last printed state, so steady states are not logged every wakeup
 
-        # ✅ 2. Not in publishing window
-        if not should_publish():
-            print("[🔴] Outside publishing window")
-            write_display_json(display=False, refresh=False)
-            time.sleep(2)
-            continue
+    changed = threading.Event()
+    changed.set()  # read the file once at startup
+    observer = Observer()
+    observer.schedule(FlightJsonHandler(json_path, changed),
+                      path=os.path.dirname(os.path.abspath(json_path)), recursive=False)
+    observer.start()
 
-        try:
-            
-            with open(json_path, "r") as f:
-                raw = f.read()
-                current_hash = hashlib.md5(raw.encode()).hexdigest()
-
-                data = load_flight_data(json_path)
-            
-        except Exception as e:
-            print(f"[❌] Error reading JSON: {e}")
-            time.sleep(2)
-            continue
+    started_wall = last_stats = time.monotonic()
+    started_cpu = time.process_time()
 
-        flight = data.get("flight") or data.get("flight_info", {}).get("flight") or "N/A"
-
-        # ✅ 3. New JSON with different flight
-        if current_hash != last_hash and flight != last_flight:
-            now = time.time()
-            if now - last_draw_time >= 30:
-                print(f"[✅] Drawing new flight: {flight}")
-                draw_card(data)
-                write_display_json(display=True, refresh=True)
-                last_draw_time = now
-                last_flight = flight
-                last_hash = current_hash
-            else:
-                print(f"[⏱️] Skipping draw (rate-limited): {flight}")
-        
-        # ✅ 4. New JSON, same flight
-        elif current_hash != last_hash and flight == last_flight:
-            print(f"[🔁] Same flight, updated data: {flight}")
-            write_display_json(display=True, refresh=False)
-            last_hash = current_hash
-
-        # ✅ 5. Same JSON, same flight
-        try:
-            ts = data.get("timestamp") or data.get("generated_at")
-            if ts:
-                if isinstance(ts, str):
-                    if ts.endswith(" UTC"):
-                        ts = ts[:-4]
-                dt = datetime.strptime(ts, "%Y-%m-%d %H:%M:%S")
-                dt = dt.replace(tzinfo=timezone.utc)
-                ts = dt.timestamp()
-            age = time.time() - ts
-            if age > 90:
-                print(f"[⚠️] Stale data ({int(age)}s old)")
-                write_display_json(display=True, refresh=False)
-        except Exception as e:
-            print(f"[⚠️] Timestamp check failed: {e}")
-
-        time.sleep(1)
+    try:
+        while True:
+            # Sleep until inotify reports a change, a batched redraw is due, or housekeeping
+            timeout = HOUSEKEEPING_SECONDS
+            if redraw_due is not None:
+                timeout = max(0.0, min(timeout, redraw_due - time.monotonic()))
+            file_changed = changed.wait(timeout)
+            changed.clear()
+            watch_stats["wakeups"] += 1
+
+            if time.monotonic() - last_stats >= STATS_INTERVAL_SECONDS:
+                report_watch_stats(started_wall, started_cpu)
+                last_stats = time.monotonic()
+
+            # ✅ 2. Not in publishing window
+            if not should_publish():
+                if status != "closed":
+                    print("[🔴] Outside publishing window")
+                    status = "closed"
+                write_display_json(display=False, refresh=False)
+                # The panel is blank: start over with a full draw when the window opens again
+                data = last_raw = last_flight = redraw_due = None
+                continue
+
+            # Re-read only on a file event (or until the first good read)
+            if file_changed or data is None:
+                try:
+                    with open(json_path, "rb") as f:
+                        raw = f.read()
+                    watch_stats["reads"] += 1
+                    if raw != last_raw or data is None:
+                        data = parse_flight_data(json.loads(raw))
+                except FileNotFoundError:
+                    # ✅ 1. Missing JSON
+                    if status != "missing":
+                        print("[🟡] JSON file missing")
+                        status = "missing"
+                    write_display_json(display=False, refresh=False)
+                    data = last_raw = last_flight = redraw_due = None
+                    continue
+                except Exception as e:
+                    # Usually a half-written file; the writer's next event brings a good read
+                    print(f"[❌] Error reading JSON: {e}")
+                    if data is None:
+                        continue
+                    raw = last_raw
+
+                if raw != last_raw:
+                    last_raw = raw
+                    flight = data.get("flight") or data.get("flight_info", {}).get("flight") or "N/A"
+                    hashes = render_hashes(data)
+
+                    # ✅ 3. Different flight: draw immediately
+                    if flight != last_flight:
+                        print(f"[✅] Drawing new flight: {flight}")
+                        draw_card(data)
+                        watch_stats["draws"] += 1
+                        write_display_json(display=True, refresh=True)
+                        last_flight = flight
+                        drawn = hashes
+                        redraw_due = None
+
+                    # ✅ 4. Same flight: redraw (batched) only if pixels would change
+                    elif hashes != drawn:
+                        delay = DETAIL_REDRAW_SECONDS if hashes[0] != drawn[0] else PROGRESS_REDRAW_SECONDS
+                        due = time.monotonic() + delay
+                        if redraw_due is None or due < redraw_due:
+                            redraw_due = due
+                    else:
+                        # Only fields the card does not show changed (timestamp jitter, key order, ...)
+                        watch_stats["redraws_avoided"] += 1
+                        redraw_due = None
+                        write_display_json(display=True, refresh=False)
+
+            # Batched same-flight redraw, from the newest data and only if it still differs
+            if redraw_due is not None and time.monotonic() >= redraw_due:
+                redraw_due = None
+                hashes = render_hashes(data)
+                if hashes != drawn:
+                    print(f"[🔁] Same flight, redrawing updated card: {last_flight}")
+                    draw_card(data)
+                    watch_stats["draws"] += 1
+                    write_display_json(display=True, refresh=True)
+                    drawn = hashes
+                else:
+                    watch_stats["redraws_avoided"] += 1
+
+            # ✅ 5. Stale data (checked on every wakeup from the last parsed data)
+            try:
+                ts = data.get("timestamp") or data.get("generated_at")
+                if ts:
+                    if isinstance(ts, str):
+                        if ts.endswith(" UTC"):
+                            ts = ts[:-4]
+                    dt = datetime.strptime(ts, "%Y-%m-%d %H:%M:%S")
+                    dt = dt.replace(tzinfo=timezone.utc)
+                    ts = dt.timestamp()
+                age = time.time() - ts
+                if age > 90:
+                    if status != "stale":
+                        print(f"[⚠️] Stale data ({int(age)}s old)")
+                        status = "stale"
+                    write_display_json(display=True, refresh=False)
+                else:
+                    status = "live"
+            except Exception as e:
+                print(f"[⚠️] Timestamp check failed: {e}")
+    except KeyboardInterrupt:
+        print("Stopping...")
+    finally:
+        report_watch_stats(started_wall, started_cpu)
+        observer.stop()
+        observer.join()
 
 if __name__ == "__main__":
     watch_and_run(JSON_PATH)
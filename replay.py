@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import cProfile
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+# Record dump1090 aircraft.json snapshots and replay them through alert18's scan loop.
+#
+#   python replay.py record evening.ndjson.gz                 # until Ctrl-C
+#   python replay.py replay evening.ndjson.gz                  # 1x, like the live feed
+#   python replay.py replay evening.ndjson.gz --speed 0 --save-alerts alerts.ndjson
+#   python replay.py replay evening.ndjson.gz --speed 0 --expect alerts.ndjson --profile scan.prof
+#   python replay.py replay evening.ndjson.gz --speed 0 --metrics metrics/   # per-stage timings
+#
+# The log is gzip'd NDJSON, one {"t": epoch, "data": <aircraft.json>} per line. Recording
+# appends a new gzip member every RECORD_MEMBER_SECONDS, so a crash loses at most that much
+# and several sessions can go into one file (gzip readers handle multi-member files).
+#
+# Replays run main_loop headless, with its stages in lockstep, under a virtual clock that
+# follows the recorded times, with adsbdb / FlightAware / weather / card5 stubbed out, so
+# they are deterministic and never touch the network. Alert transitions can be saved and
+# compared against a previous run as a regression check.
+
+AIRCRAFT_JSON_PATH = "/run/dump1090-fa/aircraft.json"
+RECORD_POLL_SECONDS = 0.25
+RECORD_MEMBER_SECONDS = 60
+
+# log_event transitions that make up the alert sequence
+ALERT_EVENTS = {"alert_start", "alert_end", "refresh_cycle", "display_refresh", "schedule"}
+
+
+class ReplayFinished(Exception):
+    pass
+
+
+def record(path, source=AIRCRAFT_JSON_PATH, limit=None):
+    # Append one line per new dump1090 snapshot (its "now" field changes once per update)
+    last_now = None
+    count = 0
+    out = None
+    member_started = 0
+    try:
+        while limit is None or count < limit:
+            try:
+                with open(source, "rb") as f:
+                    data = json.loads(f.read())
+            except (OSError, ValueError):
+                time.sleep(RECORD_POLL_SECONDS)
+                continue
+            snapshot_now = data.get("now")
+            if snapshot_now is not None and snapshot_now == last_now:
+                time.sleep(RECORD_POLL_SECONDS)
+                continue
+            last_now = snapshot_now
+
+            if out is None or time.monotonic() - member_started >= RECORD_MEMBER_SECONDS:
+                if out is not None:
+                    out.close()
+                out = gzip.open(path, "ab")
+                member_started = time.monotonic()
+            t = snapshot_now if snapshot_now is not None else time.time()
+            out.write((json.dumps({"t": t, "data": data}, separators=(",", ":")) + "\n").encode())
+            count += 1
+            if count % 60 == 0:
+                print(f"Recorded {count} snapshots")
+            time.sleep(RECORD_POLL_SECONDS)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out is not None:
+            out.close()
+    print(f"Recorded {count} snapshots to {path}")
+    return count
+
+
+def read_log(path):
+    with gzip.open(path, "rt") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class ReplayClock:
+    """Virtual clock for alert18: time is the recorded time of the current snapshot.
+
+    speed 1 replays in real time, 10 ten times faster, 0 as fast as possible.
+    """
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.now = None
+        self.started_wall = None
+        self.started_virtual = None
+
+    def set(self, t):
+        if self.started_virtual is None:
+            self.started_virtual = t
+            self.started_wall = time.monotonic()
+        self.now = t
+
+    def utcnow(self):
+        return datetime.fromtimestamp(self.now or 0, timezone.utc).replace(tzinfo=None)
+
+    async def sleep(self, seconds):
+        if not self.speed or self.started_virtual is None:
+            await asyncio.sleep(0)
+            return
+        # Wall time at which the current snapshot's successor is due
+        due = self.started_wall + (self.now + seconds - self.started_virtual) / self.speed
+        await asyncio.sleep(max(0.0, due - time.monotonic()))
+
+
+class ReplaySource:
+    # Stands in for read_aircraft_json(): next recorded snapshot, advancing the clock
+    def __init__(self, snapshots, clock, limit=None):
+        self.snapshots = iter(snapshots)
+        self.clock = clock
+        self.limit = limit
+        self.ticks = 0
+        self.aircraft = 0
+
+    def __call__(self):
+        if self.limit is not None and self.ticks >= self.limit:
+            raise ReplayFinished()
+        try:
+            snapshot = next(self.snapshots)
+        except StopIteration:
+            raise ReplayFinished()
+        self.clock.set(snapshot["t"])
+        self.ticks += 1
+        self.aircraft += len(snapshot["data"].get("aircraft", []))
+        return snapshot["data"]
+
+
+def stub_enrichment(alert18, out_dir):
+    # Deterministic, offline stand-ins for everything main_loop reaches out to
+    def lookup_adsbdb_info(hexcode):
+        return {
+            "type": "Replay Type",
+            "icao_type": "A320",
+            "manufacturer": "Replay",
+            "registration": f"R-{hexcode.upper()}",
+            "operator": "Replay Air",
+            "country": "n/a",
+        }
+
+    async def scrape_flightaware(flight_number):
+        return {"flight": flight_number, "origin_iata": "AAA", "destination_iata": "BBB",
+                "origin": "Origin", "destination": "Destination"}
+
+    alert18.lookup_adsbdb_info = lookup_adsbdb_info
+    alert18.scrape_flightaware = scrape_flightaware
+    alert18.get_temperature = lambda lat, lon: 20.0
+    alert18.launch_card_renderer = lambda json_path=None, png_path=None: None
+    alert18.ALERT_JSON_FILE = os.path.join(out_dir, "flight_card.json")
+    alert18.PNG_PATH = os.path.join(out_dir, "flight_card.png")
+
+
+def redirect_site_outputs(sites, out_dir):
+    # A replay must never overwrite a site's live alert JSON or card, whatever the sites file says
+    for i, site in enumerate(sites):
+        name = "flight_card" if i == 0 else site["name"]
+        site["alert_json"] = os.path.join(out_dir, f"{name}.json")
+        if site["card_png"]:
+            site["card_png"] = os.path.join(out_dir, f"{name}.png")
+    return sites
+
+
+def alert_key(event):
+    return [event["event"], event.get("hex"), event.get("flight"), event.get("state")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and replay aircraft.json for alert18")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="append aircraft.json snapshots to a .ndjson.gz log")
+    rec.add_argument("log")
+    rec.add_argument("--source", default=AIRCRAFT_JSON_PATH, help=f"aircraft.json to poll (default {AIRCRAFT_JSON_PATH})")
+    rec.add_argument("--limit", type=int, help="stop after this many snapshots")
+
+    rep = sub.add_parser("replay", help="feed a log through alert18.main_loop under a virtual clock")
+    rep.add_argument("log")
+    rep.add_argument("--speed", type=float, default=1.0, help="1 = real time, 0 = as fast as possible")
+    rep.add_argument("--limit", type=int, help="stop after this many snapshots")
+    rep.add_argument("--out-dir", default=".", help="where the replayed alert JSON is written")
+    rep.add_argument("--save-alerts", metavar="PATH", help="write the alert transition sequence as NDJSON")
+    rep.add_argument("--expect", metavar="PATH", help="compare the alert sequence with a saved one (exit 1 on mismatch)")
+    rep.add_argument("--profile", metavar="PATH", help="write a cProfile of the replay")
+    rep.add_argument("--metrics", metavar="DIR", help="write alert18's per-stage tick metrics to DIR")
+    rep.add_argument("--sites", metavar="PATH", help="alert18 reference sites JSON (see alert18.load_sites)")
+    rep.add_argument("--fences", metavar="PATH", help="alert18 geofences JSON (see alert18.load_fences)")
+    rep.add_argument("-q", "--quiet", action="store_true", help="don't print transition log lines")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.log, args.source, args.limit)
+        return 0
+
+    import alert18
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    stub_enrichment(alert18, args.out_dir)
+    clock = ReplayClock(args.speed)
+    alert18.clock = clock
+    source = ReplaySource(read_log(args.log), clock, args.limit)
+    if args.metrics:
+        alert18.metrics.enable(args.metrics)
+
+    events = []
+    log_event = alert18.log_event
+
+    def capture(event, **fields):
+        events.append({"t": clock.now, "event": event, **fields})
+        if not args.quiet:
+            log_event(event, **fields)
+
+    alert18.log_event = capture
+
+    profiler = cProfile.Profile() if args.profile else None
+    started = time.perf_counter()
+    try:
+        if profiler:
+            profiler.enable()
+        sites = redirect_site_outputs(alert18.load_sites(args.sites), args.out_dir) if args.sites else None
+        fences = alert18.load_fences(args.fences) if args.fences else None
+        asyncio.run(alert18.main_loop(headless=True, source=source, lockstep=True, sites=sites, fences=fences))
+    except ReplayFinished:
+        pass
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        alert18.metrics.export()
+    wall = time.perf_counter() - started
+
+    virtual = (clock.now - clock.started_virtual) if clock.started_virtual is not None else 0
+    alerts = [e for e in events if e["event"] in ALERT_EVENTS]
+    print(f"Replayed {source.ticks} snapshots ({source.aircraft} aircraft rows, {virtual:.0f}s of feed) "
+          f"in {wall:.2f}s: {source.ticks / wall if wall else 0:.1f} ticks/s, "
+          f"{1000 * wall / max(source.ticks, 1):.2f} ms/tick, {len(alerts)} alert transitions")
+
+    if args.save_alerts:
+        with open(args.save_alerts, "w") as f:
+            for event in alerts:
+                f.write(json.dumps(event, default=str) + "\n")
+
+    if args.expect:
+        with open(args.expect) as f:
+            expected = [json.loads(line) for line in f if line.strip()]
+        got = [alert_key(e) for e in alerts]
+        want = [alert_key(e) for e in expected]
+        if got != want:
+            for i, (g, w) in enumerate(zip(got + [None] * len(want), want + [None] * len(got))):
+                if g != w:
+                    print(f"❌ Alert sequence differs at #{i}: got {g}, expected {w}")
+                    break
+            return 1
+        print(f"✅ Alert sequence matches {args.expect} ({len(want)} transitions)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,19 @@
+import argparse
 import asyncio
+import gzip
+import hashlib
 import json
 import os
+import queue
+import random
+import shutil
 import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
@@ -10,12 +22,114 @@ from watchdog.events import FileSystemEventHandler
 CARD_JSON_FILE = "/usr/share/skyaware/html/flight_card.html"
 DB_FILE = "flights_stats.db"
 REGISTRATION_EXPIRY_SECONDS = 300  # 5 minutes
+REGISTRATION_CACHE_MAX = 5000      # hard cap on tracked registrations (oldest dropped first)
+
+# SQLite tuning (one long-lived reader + one writer thread, WAL so they never block each other)
+DB_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",   # safe with WAL; fsync at checkpoints instead of every commit
+    "cache_size": -16000,      # KiB (negative) -> ~16 MB page cache
+    "mmap_size": 64 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+STATEMENT_CACHE_SIZE = 64
+SCHEMA_VERSION = 1          # PRAGMA user_version; 1 = integer epoch timestamps + covering indexes
+GROUP_COMMIT_WINDOW = 0.05  # seconds the writer waits for more rows before committing a batch
+GROUP_COMMIT_MAX = 256
+
+DEBOUNCE_SECONDS = 0.5          # coalesce bursts of card-file writes (and of commits) into one pass
+STATS_INTERVAL_SECONDS = 3600   # how often the watcher prints its counters
 
 OUTPUT_DIR = "/usr/share/skyaware/html/top10"
-OUTPUT_FILE = os.path.join(OUTPUT_DIR, "index.html")
+OUTPUT_FILE = os.path.join(OUTPUT_DIR, "index.html")  # static page, rendered client-side from <period>.json
+PERIODS = ["today", "week", "all"]
+GZIP_LEVEL = 9  # every file also gets a precompressed .gz next to it for the web server to serve as-is
+
+class RegistrationCache:
+    """Registrations logged within the last `ttl` seconds, oldest first, at most `max_entries`."""
+
+    def __init__(self, ttl=REGISTRATION_EXPIRY_SECONDS, max_entries=REGISTRATION_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # registration -> epoch seconds of last insert
+        self.expired = 0
+        self.evicted = 0
+
+    def _expire(self, now):
+        while self.entries:
+            oldest = next(iter(self.entries.values()))
+            if now - oldest < self.ttl:
+                break
+            self.entries.popitem(last=False)
+            self.expired += 1
+
+    def recent(self, registration, now):
+        self._expire(now)
+        return registration in self.entries
+
+    def add(self, registration, now):
+        self.entries[registration] = now
+        self.entries.move_to_end(registration)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evicted += 1
+
+    def seed(self, conn, now):
+        # Registrations logged before a restart that are still inside the window
+        # (range scan of the (timestamp_epoch, registration, speed) index)
+        rows = conn.execute(
+            "SELECT registration, MAX(timestamp_epoch) AS last FROM flight_events "
+            "WHERE timestamp_epoch > ? GROUP BY registration ORDER BY last",
+            (int(now - self.ttl),)).fetchall()
+        for registration, last in rows:
+            self.add(registration, last)
+        self._expire(now)
+        return len(self.entries)
+
+    def memory_bytes(self):
+        return sys.getsizeof(self.entries) + sum(
+            sys.getsizeof(reg) + sys.getsizeof(ts) for reg, ts in self.entries.items())
+
+    def stats(self):
+        return {
+            "registrations": len(self.entries),
+            "registration_cache_bytes": self.memory_bytes(),
+            "registrations_expired": self.expired,
+            "registrations_evicted": self.evicted,
+        }
+
 
 # Tracking last update per registration
-last_update_per_reg = {}
+recent_registrations = RegistrationCache()
+
+# FlightDB instance, opened by main()
+db = None
+
+# Debounce state: pending loop.call_later handles and the hash of the last card file processed
+pending_process = None
+pending_regenerate = None
+last_card_hash = None
+
+# Dashboard cache: period -> {"window", "rows": {section: rows}}
+dashboard_cache = {}
+# Last JSON payload written per period (without its timestamp), to skip identical rewrites
+last_period_payload = {}
+
+# Watcher counters, printed by report_watch_stats()
+watch_stats = {
+    "file_events": 0,
+    "events_coalesced": 0,
+    "unchanged_content": 0,
+    "inserts": 0,
+    "skipped_inserts": 0,
+    "regenerations": 0,
+    "regenerations_avoided": 0,
+    "sections_cached": 0,
+    "sections_queried": 0,
+    "json_writes": 0,
+    "json_writes_skipped": 0,
+}
 
 def utcnow():
     return datetime.now(timezone.utc)
@@ -26,28 +140,264 @@ def parse_time(ts: str):
     except Exception:
         return None
 
-def init_db():
-    with sqlite3.connect(DB_FILE) as conn:
-        c = conn.cursor()
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS flight_events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp_utc TEXT NOT NULL,
-            registration TEXT NOT NULL,
-            manufacturer TEXT,
-            model TEXT,
-            origin_iata TEXT,
-            origin_name TEXT,
-            destination_iata TEXT,
-            destination_name TEXT,
-            operator TEXT,
-            flight_number TEXT,
-            speed REAL,
-            altitude INTEGER
-        )""")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_registration_time ON flight_events (registration, timestamp_utc)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON flight_events (timestamp_utc)")
-        conn.commit()
+EVENT_COLUMNS = (
+    "timestamp_epoch", "registration", "manufacturer", "model", "origin_iata", "origin_name",
+    "destination_iata", "destination_name", "operator", "flight_number", "speed", "altitude",
+)
+INSERT_EVENT_SQL = f"""
+    INSERT INTO flight_events ({", ".join(EVENT_COLUMNS)})
+    VALUES ({", ".join("?" * len(EVENT_COLUMNS))})
+"""
+
+# Rollups: per UTC day and dimension, event count and max speed for each (value, label).
+# dimension -> (value column, label column) in flight_events. NULLs are stored as '' so they
+# can be part of the primary key, and turned back into NULL when read.
+ROLLUP_DIMENSIONS = {
+    "manufacturer": ("manufacturer", None),
+    "model": ("model", None),
+    "origin": ("origin_iata", "origin_name"),
+    "destination": ("destination_iata", "destination_name"),
+    "operator": ("operator", None),
+    "flight_number": ("flight_number", None),
+    "registration": ("registration", None),
+}
+UPSERT_ROLLUP_SQL = """
+    INSERT INTO flight_rollups (day, dimension, value, label, cnt, max_speed)
+    VALUES (?, ?, ?, ?, 1, ?)
+    ON CONFLICT (day, dimension, value, label) DO UPDATE SET
+        cnt = cnt + 1,
+        max_speed = MAX(COALESCE(max_speed, excluded.max_speed), COALESCE(excluded.max_speed, max_speed))
+"""
+# All-time totals per (dimension, value, label), so 'all' reads never depend on the history length
+UPSERT_TOTAL_SQL = """
+    INSERT INTO flight_totals (dimension, value, label, cnt, max_speed)
+    VALUES (?, ?, ?, 1, ?)
+    ON CONFLICT (dimension, value, label) DO UPDATE SET
+        cnt = cnt + 1,
+        max_speed = MAX(COALESCE(max_speed, excluded.max_speed), COALESCE(excluded.max_speed, max_speed))
+"""
+
+
+def connect_db(path=DB_FILE):
+    conn = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
+    for name, value in DB_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+EVENTS_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp_epoch INTEGER NOT NULL,
+        registration TEXT NOT NULL,
+        manufacturer TEXT,
+        model TEXT,
+        origin_iata TEXT,
+        origin_name TEXT,
+        destination_iata TEXT,
+        destination_name TEXT,
+        operator TEXT,
+        flight_number TEXT,
+        speed REAL,
+        altitude INTEGER
+    )"""
+
+# Pre-migration schema (ISO-8601 text timestamps), kept for the migration benchmark
+LEGACY_EVENTS_DDL = """
+    CREATE TABLE flight_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp_utc TEXT NOT NULL,
+        registration TEXT NOT NULL,
+        manufacturer TEXT,
+        model TEXT,
+        origin_iata TEXT,
+        origin_name TEXT,
+        destination_iata TEXT,
+        destination_name TEXT,
+        operator TEXT,
+        flight_number TEXT,
+        speed REAL,
+        altitude INTEGER
+    )"""
+
+
+def create_event_indexes(c):
+    # One covering index per dashboard dimension, so time-range GROUP BYs never touch table rows.
+    # (No registration-first index: nothing looks events up by registration, and the planner
+    # would pick it for GROUP BY registration over the much smaller time-range scan.)
+    for dimension, (value_col, label_col) in ROLLUP_DIMENSIONS.items():
+        cols = [value_col] + ([label_col] if label_col else []) + (["speed"] if dimension == "registration" else [])
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_events_{dimension} ON flight_events (timestamp_epoch, {', '.join(cols)})")
+
+
+def migrate_db(conn):
+    # Schema migrations, gated on PRAGMA user_version
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(flight_events)")]
+    if "timestamp_utc" in columns:
+        # v1: ISO-8601 TEXT timestamp_utc -> INTEGER epoch seconds (table rebuild; ids are kept)
+        started = time.perf_counter()
+        other = ", ".join(EVENT_COLUMNS[1:])
+        with conn:
+            conn.execute("BEGIN")  # DDL below would otherwise autocommit statement by statement
+            conn.execute("DROP INDEX IF EXISTS idx_registration_time")
+            conn.execute("DROP INDEX IF EXISTS idx_timestamp")
+            conn.execute(EVENTS_DDL.format(table="flight_events_v1"))
+            conn.execute(f"""
+                INSERT INTO flight_events_v1 (id, timestamp_epoch, {other})
+                SELECT id, CAST(strftime('%s', timestamp_utc) AS INTEGER), {other} FROM flight_events
+            """)
+            conn.execute("DROP TABLE flight_events")
+            conn.execute("ALTER TABLE flight_events_v1 RENAME TO flight_events")
+            create_event_indexes(conn)
+        conn.execute("ANALYZE")
+        count = conn.execute("SELECT COUNT(*) FROM flight_events").fetchone()[0]
+        print(f"Migrated {count} flight_events to epoch timestamps in {time.perf_counter() - started:.1f}s")
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def init_db(conn, rebuild_rollups_now=False):
+    c = conn.cursor()
+    c.execute(EVENTS_DDL.format(table="flight_events"))
+    migrate_db(conn)
+    create_event_indexes(c)
+    has_rollups = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'flight_rollups'").fetchone()
+    has_totals = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'flight_totals'").fetchone()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS flight_rollups (
+        day TEXT NOT NULL,
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        label TEXT NOT NULL,
+        cnt INTEGER NOT NULL,
+        max_speed REAL,
+        PRIMARY KEY (day, dimension, value, label)
+    ) WITHOUT ROWID""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rollups_dimension ON flight_rollups (dimension, day)")
+    # rollup_count() lookups; today/week queries use idx_rollups_dimension (see rollup_source)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rollups_value ON flight_rollups (dimension, value, label, day)")
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS flight_totals (
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        label TEXT NOT NULL,
+        cnt INTEGER NOT NULL,
+        max_speed REAL,
+        PRIMARY KEY (dimension, value, label)
+    ) WITHOUT ROWID""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_totals_cnt ON flight_totals (dimension, cnt)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_totals_speed ON flight_totals (dimension, max_speed)")
+    conn.commit()
+    if rebuild_rollups_now or not has_rollups or not has_totals:
+        rebuild_rollups(conn)
+
+
+def rebuild_rollups(conn):
+    # Recompute flight_rollups and flight_totals from flight_events (first start on an existing DB,
+    # or --rebuild-rollups)
+    with conn:
+        conn.execute("DELETE FROM flight_rollups")
+        conn.execute("DELETE FROM flight_totals")
+        for dimension, (value_col, label_col) in ROLLUP_DIMENSIONS.items():
+            label = f"COALESCE({label_col}, '')" if label_col else "''"
+            conn.execute(f"""
+                INSERT INTO flight_rollups (day, dimension, value, label, cnt, max_speed)
+                SELECT date(timestamp_epoch, 'unixepoch'), ?, COALESCE({value_col}, ''), {label}, COUNT(*), MAX(speed)
+                FROM flight_events
+                GROUP BY 1, 3, 4
+            """, (dimension,))
+        conn.execute("""
+            INSERT INTO flight_totals (dimension, value, label, cnt, max_speed)
+            SELECT dimension, value, label, SUM(cnt), MAX(max_speed)
+            FROM flight_rollups
+            GROUP BY dimension, value, label
+        """)
+    count = conn.execute("SELECT COUNT(*) FROM flight_rollups").fetchone()[0]
+    totals = conn.execute("SELECT COUNT(*) FROM flight_totals").fetchone()[0]
+    print(f"Rebuilt flight_rollups: {count} rows, flight_totals: {totals} rows")
+
+
+def rollup_rows(rows):
+    # flight_rollups upserts for a batch of INSERT_EVENT_SQL parameter tuples
+    for row in rows:
+        event = dict(zip(EVENT_COLUMNS, row))
+        day = datetime.fromtimestamp(event["timestamp_epoch"], timezone.utc).date().isoformat()
+        for dimension, (value_col, label_col) in ROLLUP_DIMENSIONS.items():
+            value = event[value_col] or ""
+            label = (event[label_col] or "") if label_col else ""
+            yield day, dimension, value, label, event["speed"]
+
+
+class FlightDB:
+    """Persistent stats DB connections: `reader` for queries, inserts group-committed by a writer thread."""
+
+    def __init__(self, path=DB_FILE, on_commit=None):
+        self.path = path
+        self.on_commit = on_commit
+        self.reader = connect_db(path)
+        self.reader.row_factory = sqlite3.Row
+        init_db(self.reader)
+        self.pending = queue.Queue()
+        self.commits = 0
+        self.rows_written = 0
+        self.thread = threading.Thread(target=self._writer, name="db-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, row):
+        self.pending.put(row)
+
+    def _writer(self):
+        conn = connect_db(self.path)
+        try:
+            while True:
+                row = self.pending.get()
+                if row is None:
+                    return
+                batch = [row]
+                deadline = time.monotonic() + GROUP_COMMIT_WINDOW
+                stop = False
+                while len(batch) < GROUP_COMMIT_MAX:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        row = self.pending.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if row is None:
+                        stop = True
+                        break
+                    batch.append(row)
+
+                try:
+                    # Events and their rollups commit together, so the two never disagree
+                    with conn:
+                        conn.executemany(INSERT_EVENT_SQL, batch)
+                        rollups = list(rollup_rows(batch))
+                        conn.executemany(UPSERT_ROLLUP_SQL, rollups)
+                        conn.executemany(UPSERT_TOTAL_SQL, (rollup[1:] for rollup in rollups))
+                    self.commits += 1
+                    self.rows_written += len(batch)
+                    if self.on_commit:
+                        self.on_commit(batch)
+                except sqlite3.Error as e:
+                    print(f"Error writing {len(batch)} flight event(s): {e}")
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def close(self):
+        self.pending.put(None)
+        self.thread.join()
+        self.reader.close()
+        print(f"DB writer: {self.rows_written} rows in {self.commits} commits")
+
 
 def insert_flight_event(data):
     ts = utcnow()
@@ -56,138 +406,284 @@ def insert_flight_event(data):
         return False
 
     # Skip if updated within 5 minutes for this registration
-    last_ts = last_update_per_reg.get(registration)
-    if last_ts and (ts - last_ts).total_seconds() < REGISTRATION_EXPIRY_SECONDS:
+    if recent_registrations.recent(registration, ts.timestamp()):
         return False
-    last_update_per_reg[registration] = ts
+    recent_registrations.add(registration, ts.timestamp())
 
     aircraft_info = data.get('aircraft_info', {})
     flight_info = data.get('flight_info', {})
     speed = data.get('speed')
     altitude = data.get('altitude')
 
-    with sqlite3.connect(DB_FILE) as conn:
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO flight_events (
-                timestamp_utc, registration, manufacturer, model, origin_iata, origin_name,
-                destination_iata, destination_name, operator, flight_number, speed, altitude
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            ts.isoformat(),
-            registration,
-            aircraft_info.get('manufacturer'),
-            aircraft_info.get('type'),
-            flight_info.get('origin_iata'),
-            flight_info.get('origin'),
-            flight_info.get('destination_iata'),
-            flight_info.get('destination'),
-            aircraft_info.get('operator'),
-            data.get('flight'),
-            speed,
-            altitude
-        ))
-        conn.commit()
+    # Queued for the writer thread; the dashboard is rebuilt once the row is committed
+    db.submit((
+        int(ts.timestamp()),
+        registration,
+        aircraft_info.get('manufacturer'),
+        aircraft_info.get('type'),
+        flight_info.get('origin_iata'),
+        flight_info.get('origin'),
+        flight_info.get('destination_iata'),
+        flight_info.get('destination'),
+        aircraft_info.get('operator'),
+        data.get('flight'),
+        speed,
+        altitude
+    ))
     return True
 
 class JsonFileHandler(FileSystemEventHandler):
     def __init__(self, file_path, loop):
-        self.file_path = file_path
+        self.file_path = os.path.abspath(file_path)
         self.loop = loop
 
-    def on_modified(self, event):
-        if event.src_path == self.file_path:
-            # Schedule the synchronous function to run in the event loop thread
-            self.loop.call_soon_threadsafe(process_json_file_and_update_html)
+    def on_any_event(self, event):
+        # Only writes that can change the file's content (the watcher's own reads raise
+        # opened/closed events too)
+        if event.event_type not in ("modified", "created", "moved"):
+            return
+        path = getattr(event, "dest_path", "") if event.event_type == "moved" else event.src_path
+        if os.path.abspath(path) != self.file_path:
+            return
+        watch_stats["file_events"] += 1
+        # Hand over to the event loop thread, where the burst is debounced
+        self.loop.call_soon_threadsafe(schedule_process)
+
+
+def schedule_process():
+    # Restart the debounce window; the file is read once the writes have settled
+    global pending_process
+    if pending_process is not None:
+        pending_process.cancel()
+        watch_stats["events_coalesced"] += 1
+    pending_process = asyncio.get_event_loop().call_later(DEBOUNCE_SECONDS, process_json_file_and_update_html)
+
+
+def schedule_regenerate(rows):
+    # Called (on the loop thread) after each writer commit; several commits make one rebuild
+    global pending_regenerate
+    invalidate_dashboard_cache(rows)
+    if pending_regenerate is not None:
+        watch_stats["regenerations_avoided"] += 1
+        return
+    pending_regenerate = asyncio.get_event_loop().call_later(DEBOUNCE_SECONDS, regenerate)
+
+
+def regenerate():
+    global pending_regenerate
+    pending_regenerate = None
+    save_dashboard_html()
+    watch_stats["regenerations"] += 1
 
 
 def process_json_file_and_update_html():
+    global pending_process, last_card_hash
+    pending_process = None
     try:
-        with open(CARD_JSON_FILE, 'r') as f:
-            text = f.read()
-        if not text.strip():
+        with open(CARD_JSON_FILE, 'rb') as f:
+            raw = f.read()
+        if not raw.strip():
+            return
+        card_hash = hashlib.sha1(raw).hexdigest()
+        if card_hash == last_card_hash:
+            watch_stats["unchanged_content"] += 1
             return
-        data = json.loads(text)
+        data = json.loads(raw)
     except Exception as e:
         print(f"Error reading/parsing JSON: {e}")
         return
+    last_card_hash = card_hash
 
     inserted = insert_flight_event(data)
     reg = data.get('aircraft_info', {}).get('registration', 'Unknown')
     if inserted:
+        # The dashboard is regenerated once the writer thread has committed the row
+        watch_stats["inserts"] += 1
         print(f"Inserted/updated flight for reg: {reg}")
     else:
+        # Nothing was written, so the dashboard would come out identical
+        watch_stats["skipped_inserts"] += 1
+        watch_stats["regenerations_avoided"] += 1
         print(f"Skipped insert for reg: {reg} (recent update)")
 
-    save_dashboard_html()
 
+def report_watch_stats():
+    stats = {**watch_stats, **recent_registrations.stats()}
+    print("Watcher: " + ", ".join(f"{name}={count}" for name, count in stats.items()))
 
 
-def query_top_10(period: str):
-    now = datetime.now(timezone.utc)
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+# Dashboard sections: (name, rollup dimension, how many rows are shown)
+SECTIONS = [
+    ("manufacturers", "manufacturer", 10),
+    ("models", "model", 10),
+    ("origins", "origin", 10),
+    ("destinations", "destination", 10),
+    ("operators", "operator", 10),
+    ("flight_numbers", "flight_number", 10),
+    ("fastest_flights", "registration", 3),
+]
+
 
+def period_start(period, now):
     if period == 'today':
-        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif period == 'week':
-        start = now - timedelta(days=7)
-    else:
-        start = None  # all time
-
-    def q(col, extra_cols=None):
-        extra = ""
-        if extra_cols:
-            extra = ", " + ", ".join(extra_cols)
-        base = f"SELECT {col}, COUNT(*) as cnt{extra} FROM flight_events"
-        if start:
-            base += f" WHERE timestamp_utc >= '{start.isoformat()}'"
-        base += f" GROUP BY {col}"
-        if extra_cols:
-            group_cols = ", ".join([col] + extra_cols)
-            base = f"SELECT {group_cols}, COUNT(*) as cnt FROM flight_events"
-            if start:
-                base += f" WHERE timestamp_utc >= '{start.isoformat()}'"
-            base += f" GROUP BY {group_cols}"
-        base += " ORDER BY cnt DESC LIMIT 10"
-        return base
-
-    c.execute(q('manufacturer'))
-    manufacturers = c.fetchall()
-
-    c.execute(q('model'))
-    models = c.fetchall()
-
-    c.execute(q('origin_iata', ['origin_name']))
-    origins = c.fetchall()
-
-    c.execute(q('destination_iata', ['destination_name']))
-    destinations = c.fetchall()
-
-    c.execute(q('operator'))
-    operators = c.fetchall()
-
-    c.execute(q('flight_number'))
-    flight_numbers = c.fetchall()
-
-    speed_query = "SELECT registration, MAX(speed) as max_speed FROM flight_events"
+        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'week':
+        return now - timedelta(days=7)
+    return None  # all time
+
+
+def rollup_source(period, dimension, start):
+    # Rows (value, label, cnt, max_speed) of one dimension for 'today' or 'week' ('all' reads
+    # flight_totals). Whole days come from flight_rollups; the rolling week also starts mid-day,
+    # so that one boundary day is counted from the raw events (an index range scan of a single
+    # day). Pinned to the (dimension, day) index: given the GROUP BY value, label on top, the
+    # planner otherwise prefers idx_rollups_value and walks every day of the dimension.
+    value_col, label_col = ROLLUP_DIMENSIONS[dimension]
+    sql = ("SELECT value, label, cnt, max_speed FROM flight_rollups INDEXED BY idx_rollups_dimension "
+           "WHERE dimension = ? AND day >= ?")
+    if period == 'today':
+        return sql, [dimension, start.date().isoformat()]
+    boundary_end = start.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    label = f"COALESCE({label_col}, '')" if label_col else "''"
+    speed = "speed" if dimension == "registration" else "NULL"  # keeps the scan index-only
+    sql += f"""
+        UNION ALL
+        SELECT COALESCE({value_col}, ''), {label}, 1, {speed} FROM flight_events
+        WHERE timestamp_epoch >= ? AND timestamp_epoch < ?"""
+    return sql, [dimension, boundary_end.date().isoformat(), int(start.timestamp()), int(boundary_end.timestamp())]
+
+
+def query_top_10(period: str, sections=None):
+    now = datetime.now(timezone.utc)
+    c = db.reader.cursor()
+    start = period_start(period, now)
+
+    def source(dimension):
+        return rollup_source(period, dimension, start)
+
+    def top(dimension, limit=10):
+        value_col, label_col = ROLLUP_DIMENSIONS[dimension]
+        cols = f"NULLIF(value, '') AS {value_col}"
+        if label_col:
+            cols += f", NULLIF(label, '') AS {label_col}"
+        if period == 'all':
+            # One row per (value, label) already: read the top of the count index
+            c.execute(f"SELECT {cols}, cnt FROM flight_totals WHERE dimension = ? "
+                      f"ORDER BY cnt DESC LIMIT {limit}", (dimension,))
+            return c.fetchall()
+        sql, params = source(dimension)
+        c.execute(f"SELECT {cols}, SUM(cnt) AS cnt FROM ({sql}) GROUP BY value, label "
+                  f"ORDER BY cnt DESC LIMIT {limit}", params)
+        return c.fetchall()
+
+    def fastest(dimension, limit=3):
+        if period == 'all':
+            c.execute(f"SELECT value AS registration, max_speed FROM flight_totals WHERE dimension = ? "
+                      f"ORDER BY max_speed DESC LIMIT {limit}", (dimension,))
+            return c.fetchall()
+        sql, params = source(dimension)
+        c.execute(f"SELECT value AS registration, MAX(max_speed) AS max_speed FROM ({sql}) "
+                  f"GROUP BY value ORDER BY max_speed DESC LIMIT {limit}", params)
+        return c.fetchall()
+
+    data = {}
+    for name, dimension, limit in SECTIONS:
+        if sections is None or name in sections:
+            data[name] = (fastest if name == "fastest_flights" else top)(dimension, limit)
+
+    c.close()
+    return data
+
+
+def rollup_count(dimension, value, label, start):
+    # Current count of one (value, label) in a period. For the rolling week the whole boundary
+    # day is included, which can only over-count (invalidate too often, never too rarely).
+    table = "flight_rollups" if start else "flight_totals"
+    sql = f"SELECT COALESCE(SUM(cnt), 0) FROM {table} WHERE dimension = ? AND value = ? AND label = ?"
+    params = [dimension, value, label]
     if start:
-        speed_query += f" WHERE timestamp_utc >= '{start.isoformat()}'"
-    speed_query += " GROUP BY registration ORDER BY max_speed DESC LIMIT 3"
-    c.execute(speed_query)
-    fastest_flights = c.fetchall()
+        sql += " AND day >= ?"
+        params.append(start.date().isoformat())
+    return db.reader.execute(sql, params).fetchone()[0]
 
-    conn.close()
-    return {
-        "manufacturers": manufacturers,
-        "models": models,
-        "origins": origins,
-        "destinations": destinations,
-        "operators": operators,
-        "flight_numbers": flight_numbers,
-        "fastest_flights": fastest_flights,
-    }
+
+def section_may_change(name, dimension, limit, rows, event, start):
+    value_col, label_col = ROLLUP_DIMENSIONS[dimension]
+    value = event[value_col]
+    label = event[label_col] if label_col else None
+
+    if name == "fastest_flights":
+        speed = event["speed"]
+        if speed is None:
+            return False
+        if len(rows) < limit or any(row["registration"] == value for row in rows):
+            return True
+        return rows[-1]["max_speed"] is None or speed >= rows[-1]["max_speed"]
+
+    if len(rows) < limit:
+        return True
+    for row in rows:
+        if row[value_col] == (value or None) and (not label_col or row[label_col] == (label or None)):
+            return True  # already listed: its count (and maybe its rank) changed
+    # Not listed: only matters once it reaches the current 10th-place count
+    return rollup_count(dimension, value or "", label or "", start) >= rows[-1]["cnt"]
+
+
+def invalidate_dashboard_cache(rows):
+    # Drop only the cached sections an inserted batch could change
+    now = utcnow()
+    for period, entry in dashboard_cache.items():
+        start = period_start(period, now)
+        for row in rows:
+            event = dict(zip(EVENT_COLUMNS, row))
+            for name, dimension, limit in SECTIONS:
+                cached = entry["rows"].get(name)
+                if cached is not None and section_may_change(name, dimension, limit, cached, event, start):
+                    del entry["rows"][name]
+
+
+def dashboard_cache_entry(period):
+    # Cached sections for a period, discarded wholesale when its time window moved
+    # past any data: a new UTC day for 'today', an event sliding out of the rolling week
+    now = utcnow()
+    entry = dashboard_cache.get(period)
+    if entry is not None:
+        if period == 'today' and entry["window"] != now.date():
+            entry = None
+        elif period == 'week':
+            start = period_start(period, now)
+            left = db.reader.execute(
+                "SELECT 1 FROM flight_events WHERE timestamp_epoch >= ? AND timestamp_epoch < ? LIMIT 1",
+                (int(entry["window"].timestamp()), int(start.timestamp()))).fetchone()
+            if left:
+                entry = None
+            else:
+                entry["window"] = start
+    if entry is None:
+        window = {"today": now.date(), "week": period_start(period, now)}.get(period)
+        entry = dashboard_cache[period] = {"window": window, "rows": {}}
+    return entry
+
+
+def period_rows(period):
+    entry = dashboard_cache_entry(period)
+    missing = [name for name, _, _ in SECTIONS if name not in entry["rows"]]
+    if missing:
+        entry["rows"].update(query_top_10(period, missing))
+    watch_stats["sections_queried"] += len(missing)
+    watch_stats["sections_cached"] += len(SECTIONS) - len(missing)
+    return entry["rows"]
+
+# Section headings and columns, in page order; rows are sent as arrays in this column order
+SECTION_LAYOUT = {
+    "manufacturers": ("🏭 Top 10 Manufacturers", ["manufacturer", "cnt"]),
+    "models": ("✈️ Top 10 Models", ["model", "cnt"]),
+    "origins": ("🌍 Top 10 Origins", ["origin_iata", "origin_name", "cnt"]),
+    "destinations": ("🏁 Top 10 Destinations", ["destination_iata", "destination_name", "cnt"]),
+    "operators": ("🧑‍✈️ Top 10 Operators", ["operator", "cnt"]),
+    "flight_numbers": ("🎫 Top 10 Flight Numbers", ["flight_number", "cnt"]),
+    "fastest_flights": ("🚀 Top 3 Fastest Flights", ["registration", "max_speed"]),
+}
 
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -265,123 +761,279 @@ HTML_TEMPLATE = """
   <button class="tab-btn" data-tab="all">All Time</button>
 </div>
 
-<div id="today" class="tab-content">
-  {content_today}
-</div>
-
-<div id="week" class="tab-content" style="display:none;">
-  {content_week}
-</div>
-
-<div id="all" class="tab-content" style="display:none;">
-  {content_all}
-</div>
+<div id="content" class="tab-content"></div>
 
 <script>
+  const SECTIONS = {sections_json};
+  const REFRESH_MS = {refresh_ms};
   const tabs = document.querySelectorAll('.tab-btn');
-  const contents = document.querySelectorAll('.tab-content');
+  const content = document.getElementById('content');
+  let current = 'today';
+
+  function el(tag, text, cls) {{
+    const e = document.createElement(tag);
+    if (text !== undefined) e.textContent = text;
+    if (cls) e.className = cls;
+    return e;
+  }}
+
+  function render(data) {{
+    const frag = document.createDocumentFragment();
+    for (const [name, title, cols] of SECTIONS) {{
+      const h = el('h2', title);
+      if (name === 'fastest_flights') h.style.marginTop = '2rem';
+      frag.appendChild(h);
+      const table = el('table');
+      const head = table.createTHead().insertRow();
+      for (const c of cols) {{
+        head.appendChild(el('th', name === 'fastest_flights'
+          ? (c === 'max_speed' ? 'Max Speed (knots)' : 'Registration')
+          : c.replace(/_/g, ' ').replace(/\\b\\w/g, ch => ch.toUpperCase())));
+      }}
+      const body = table.createTBody();
+      for (const row of data.sections[name] || []) {{
+        const tr = body.insertRow();
+        if (name === 'fastest_flights') tr.className = 'fastest';
+        row.forEach((v, i) => {{
+          if (cols[i] === 'max_speed') v = v ? v.toFixed(1) : null;
+          tr.appendChild(el('td', v === null || v === '' ? '-' : String(v)));
+        }});
+      }}
+      frag.appendChild(table);
+    }}
+    content.replaceChildren(frag);
+  }}
+
+  async function load() {{
+    try {{
+      const resp = await fetch(current + '.json', {{ cache: 'no-cache' }});
+      if (resp.ok) render(await resp.json());
+    }} catch (e) {{
+      console.error(e);
+    }}
+  }}
 
   tabs.forEach(tab => {{
     tab.addEventListener('click', () => {{
       tabs.forEach(t => t.classList.remove('active'));
-      contents.forEach(c => c.style.display = 'none');
       tab.classList.add('active');
-      document.getElementById(tab.dataset.tab).style.display = 'block';
+      current = tab.dataset.tab;
+      load();
     }});
   }});
+  load();
+  setInterval(load, REFRESH_MS);
 </script>
 
 </body>
 </html>
 """
+PAGE_REFRESH_SECONDS = 60  # how often an open page re-fetches the current tab's JSON
 
-def render_table(rows, cols):
-    html = "<table><thead><tr>"
-    for c in cols:
-        html += f"<th>{c.replace('_', ' ').title()}</th>"
-    html += "</tr></thead><tbody>"
-    for row in rows:
-        html += "<tr>"
-        for c in cols:
-            val = row[c]
-            if val is None:
-                val = "-"
-            html += f"<td>{val}</td>"
-        html += "</tr>"
-    html += "</tbody></table>"
-    return html
-
-def render_top10_content(data):
-    html = ""
-
-    html += "<h2>🏭 Top 10 Manufacturers</h2>"
-    html += render_table(data["manufacturers"], ["manufacturer", "cnt"])
-
-    html += "<h2>✈️ Top 10 Models</h2>"
-    html += render_table(data["models"], ["model", "cnt"])
 
-    html += "<h2>🌍 Top 10 Origins</h2>"
-    html += render_table(data["origins"], ["origin_iata", "origin_name", "cnt"])
+def write_static(path, data):
+    # Atomic write of path and path.gz (mtime=0 so identical data gives identical .gz bytes)
+    for target, payload in ((path, data), (path + ".gz", gzip.compress(data, GZIP_LEVEL, mtime=0))):
+        tmp = target + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, target)
 
-    html += "<h2>🏁 Top 10 Destinations</h2>"
-    html += render_table(data["destinations"], ["destination_iata", "destination_name", "cnt"])
 
-    html += "<h2>🧑‍✈️ Top 10 Operators</h2>"
-    html += render_table(data["operators"], ["operator", "cnt"])
+def write_dashboard_page():
+    # The page never changes at runtime: write it at startup, and only if it differs
+    sections = [[name, *SECTION_LAYOUT[name]] for name, _, _ in SECTIONS]
+    html = HTML_TEMPLATE.format(
+        sections_json=json.dumps(sections, ensure_ascii=False),
+        refresh_ms=PAGE_REFRESH_SECONDS * 1000,
+    ).encode("utf-8")
+    try:
+        with open(OUTPUT_FILE, "rb") as f:
+            if f.read() == html:
+                return
+    except FileNotFoundError:
+        pass
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    write_static(OUTPUT_FILE, html)
+    print(f"Dashboard page written: {OUTPUT_FILE}")
 
-    html += "<h2>🎫 Top 10 Flight Numbers</h2>"
-    html += render_table(data["flight_numbers"], ["flight_number", "cnt"])
 
-    html += '<h2 style="margin-top:2rem;">🚀 Top 3 Fastest Flights</h2>'
-    html += "<table><thead><tr><th>Registration</th><th>Max Speed (knots)</th></tr></thead><tbody>"
-    for row in data["fastest_flights"]:
-        reg = row["registration"] or "-"
-        speed = f"{row['max_speed']:.1f}" if row["max_speed"] else "-"
-        html += f"<tr class='fastest'><td>{reg}</td><td>{speed}</td></tr>"
-    html += "</tbody></table>"
+def period_payload(rows):
+    sections = {}
+    for name, _, _ in SECTIONS:
+        cols = SECTION_LAYOUT[name][1]
+        sections[name] = [[row[c] for c in cols] for row in rows[name]]
+    return sections
 
-    return html
 
 def save_dashboard_html():
-    data_today = query_top_10("today")
-    data_week = query_top_10("week")
-    data_all = query_top_10("all")
-
-    content_today = render_top10_content(data_today)
-    content_week = render_top10_content(data_week)
-    content_all = render_top10_content(data_all)
-
-    html = HTML_TEMPLATE.format(
-        content_today=content_today,
-        content_week=content_week,
-        content_all=content_all,
-    )
-
+    # Sections come from dashboard_cache; only those invalidated since the last save are re-queried.
+    # Each period is a small JSON file, rewritten only when its rows changed.
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        f.write(html)
-    print(f"Dashboard HTML updated: {OUTPUT_FILE}")
+    for period in PERIODS:
+        sections = period_payload(period_rows(period))
+        key = json.dumps(sections, separators=(",", ":"), ensure_ascii=False)
+        if last_period_payload.get(period) == key:
+            watch_stats["json_writes_skipped"] += 1
+            continue
+        data = {"generated": utcnow().strftime("%Y-%m-%d %H:%M:%S UTC"), "sections": sections}
+        write_static(os.path.join(OUTPUT_DIR, f"{period}.json"),
+                     json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+        last_period_payload[period] = key
+        watch_stats["json_writes"] += 1
+        print(f"Dashboard data updated: {period}.json")
 
 async def main():
-    init_db()
+    global db
     loop = asyncio.get_event_loop()
+    # Rebuild the dashboard on the loop thread once the writer has committed new rows
+    db = FlightDB(DB_FILE, on_commit=lambda rows: loop.call_soon_threadsafe(schedule_regenerate, rows))
+    seeded = recent_registrations.seed(db.reader, utcnow().timestamp())
+    print(f"Seeded {seeded} registrations logged in the last {REGISTRATION_EXPIRY_SECONDS}s")
     event_handler = JsonFileHandler(CARD_JSON_FILE, loop)
     observer = Observer()
     observer.schedule(event_handler, path=os.path.dirname(CARD_JSON_FILE) or '.', recursive=False)
     observer.start()
 
     # Call WITHOUT await here since function is sync
+    write_dashboard_page()
+    save_dashboard_html()
     process_json_file_and_update_html()
 
     try:
         while True:
-            await asyncio.sleep(1)
+            await asyncio.sleep(STATS_INTERVAL_SECONDS)
+            report_watch_stats()
     except KeyboardInterrupt:
         print("Stopping...")
+    finally:
         observer.stop()
         observer.join()
+        db.close()
+        report_watch_stats()
+
+
+BENCH_REPEATS = 5
+
+
+def synthetic_events(count, days=365, seed=42):
+    # Skewed (Pareto) value distributions, so top-10 lists look like real traffic
+    rng = random.Random(seed)
+    end = int(time.time())
+
+    def pick(prefix, n):
+        return f"{prefix}{int(rng.paretovariate(1.1)) % n:03d}"
+
+    for _ in range(count):
+        origin = pick("O", 300)
+        destination = pick("D", 300)
+        yield (
+            end - rng.randrange(days * 86400),
+            pick("C-", 5000),
+            pick("Manufacturer ", 20),
+            pick("Model ", 120),
+            origin,
+            f"{origin} Airport, Somewhere",
+            destination,
+            f"{destination} Airport, Elsewhere",
+            pick("Operator ", 150),
+            pick("FLT", 2000),
+            rng.uniform(120, 620),
+            rng.randrange(1000, 41000),
+        )
+
+
+def bench_schema(rows, work_dir=None):
+    # Same synthetic data in the legacy (ISO text, no covering indexes) and the migrated
+    # (epoch + covering indexes) schema; times the raw time-range top-10 queries on both
+    # and the rollup-backed query_top_10 on the migrated DB.
+    global db
+    work_dir = work_dir or tempfile.mkdtemp(prefix="top10bench-")
+    legacy_path = os.path.join(work_dir, "legacy.db")
+    migrated_path = os.path.join(work_dir, "migrated.db")
+
+    print(f"Generating {rows:,} synthetic flight_events in {work_dir} ...")
+    started = time.perf_counter()
+    conn = connect_db(legacy_path)
+    conn.execute(LEGACY_EVENTS_DDL)
+    conn.execute("CREATE INDEX idx_registration_time ON flight_events (registration, timestamp_utc)")
+    conn.execute("CREATE INDEX idx_timestamp ON flight_events (timestamp_utc)")
+    legacy_rows = ((datetime.fromtimestamp(row[0], timezone.utc).isoformat(),) + row[1:]
+                   for row in synthetic_events(rows))
+    with conn:
+        conn.executemany(f"INSERT INTO flight_events (timestamp_utc, {', '.join(EVENT_COLUMNS[1:])}) "
+                         f"VALUES ({', '.join('?' * len(EVENT_COLUMNS))})", legacy_rows)
+    conn.close()
+    print(f"  generated in {time.perf_counter() - started:.1f}s")
+
+    shutil.copyfile(legacy_path, migrated_path)
+    started = time.perf_counter()
+    conn = connect_db(migrated_path)
+    init_db(conn)  # migration + rollup build
+    conn.close()
+    print(f"  migration + rollups in {time.perf_counter() - started:.1f}s")
+
+    def timed(conn, sql, params):
+        times = []
+        for _ in range(BENCH_REPEATS):
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            times.append((time.perf_counter() - started) * 1000)
+        return statistics.median(times)
+
+    now = datetime.now(timezone.utc)
+    legacy = connect_db(legacy_path)
+    migrated = connect_db(migrated_path)
+    results = []
+    for period in ("today", "week"):
+        start = period_start(period, now)
+        for dimension, (value_col, label_col) in ROLLUP_DIMENSIONS.items():
+            cols = value_col + (f", {label_col}" if label_col else "")
+            if dimension == "registration":
+                select, order = "registration, MAX(speed) AS m", "m DESC LIMIT 3"
+            else:
+                select, order = f"{cols}, COUNT(*) AS cnt", "cnt DESC LIMIT 10"
+            old_ms = timed(legacy, f"SELECT {select} FROM flight_events WHERE timestamp_utc >= ? "
+                                   f"GROUP BY {cols} ORDER BY {order}", (start.isoformat(),))
+            new_ms = timed(migrated, f"SELECT {select} FROM flight_events WHERE timestamp_epoch >= ? "
+                                     f"GROUP BY {cols} ORDER BY {order}", (int(start.timestamp()),))
+            results.append((period, dimension, old_ms, new_ms))
+    legacy.close()
+    migrated.close()
+
+    print(f"\n{'period':<7} {'dimension':<14} {'text ms':>9} {'epoch ms':>9} {'speedup':>8}")
+    for period, dimension, old_ms, new_ms in results:
+        print(f"{period:<7} {dimension:<14} {old_ms:>9.1f} {new_ms:>9.1f} {old_ms / max(new_ms, 1e-6):>7.1f}x")
+
+    db = FlightDB(migrated_path)
+    try:
+        print()
+        for period in ("today", "week", "all"):
+            times = []
+            for _ in range(BENCH_REPEATS):
+                started = time.perf_counter()
+                query_top_10(period)
+                times.append((time.perf_counter() - started) * 1000)
+            print(f"query_top_10({period!r}) from rollups: {statistics.median(times):.1f} ms (all 7 sections)")
+    finally:
+        db.close()
+    return results
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Top-10 flight stats dashboard")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="recompute flight_rollups from flight_events and exit")
+    parser.add_argument("--bench-schema", metavar="ROWS", type=int, nargs="?", const=2_000_000,
+                        help="benchmark text vs epoch timestamps on a synthetic table (default 2,000,000 rows)")
+    args = parser.parse_args()
+
+    if args.bench_schema:
+        bench_schema(args.bench_schema)
+    elif args.rebuild_rollups:
+        conn = connect_db(DB_FILE)
+        init_db(conn, rebuild_rollups_now=True)
+        conn.close()
+    else:
+        asyncio.run(main())
 